@@ -0,0 +1,5 @@
+# Celery-приложение должно подниматься вместе с Django,
+# чтобы @shared_task в tender/tasks.py привязывались к нему
+from .celery import app as celery_app
+
+__all__ = ("celery_app",)
@@ -0,0 +1,23 @@
+"""
+Celery-приложение проекта (фоновая проценка ABCP).
+
+Воркер запускается из каталога с manage.py:
+    celery -A abcp_tender_portal worker -l info
+"""
+
+import os
+from pathlib import Path
+
+from celery import Celery
+from dotenv import load_dotenv
+
+# воркер стартует не через manage.py/wsgi.py, поэтому .env грузим и здесь
+load_dotenv(Path(__file__).resolve().parent.parent / ".env", override=False)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'abcp_tender_portal.settings')
+
+app = Celery("abcp_tender_portal")
+
+# все настройки Celery берём из settings.py с префиксом CELERY_
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
@@ -12,14 +12,37 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 import logging
 import logging
+import tempfile
 from pathlib import Path
 
+from django.contrib.messages import constants as message_constants
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Отдача файлов задач (вход и результат) через nginx (X-Accel-Redirect): префикс internal-
+# локации, которая смотрит в MEDIA_ROOT, например "/internal/":
+#     location /internal/ { internal; alias /var/app/media/; sendfile on; }
+# Не должен совпадать с MEDIA_URL. Пусто — файл отдаёт сам Django.
+RESULT_ACCEL_REDIRECT_PREFIX = os.environ.get("DJANGO_ACCEL_REDIRECT_PREFIX", "")
+
+# --- Загрузка файлов ---
+# Загрузки всегда пишутся во временный файл (а не в память процесса).
+# Временный каталог — рядом с MEDIA_ROOT (тот же том, но не внутри него):
+# FileSystemStorage переносит файл на место одним os.rename,
+# без повторного чтения и копирования блоками по 64 КБ, а недописанные
+# загрузки не попадают в каталог, который видит nginx.
+FILE_UPLOAD_HANDLERS = [
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+FILE_UPLOAD_TEMP_DIR = os.environ.get(
+    "DJANGO_FILE_UPLOAD_TEMP_DIR",
+    str(BASE_DIR / "upload_tmp"),
+)
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -73,6 +96,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    "whitenoise.middleware.WhiteNoiseMiddleware",  # static через WhiteNoise
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -121,6 +145,16 @@ if USE_POSTGRES:
             "PASSWORD": os.environ.get("POSTGRESQL_PASSWORD"),
             "HOST": os.environ.get("POSTGRESQL_HOST"),
             "PORT": os.environ.get("POSTGRESQL_PORT", "5432"),
+            # Постоянные соединения: воркер не открывает новое соединение
+            # (TCP + авторизация) на каждый запрос; перед повторным
+            # использованием Django проверяет, что оно живо
+            "CONN_MAX_AGE": int(os.environ.get("POSTGRESQL_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
+            # За PgBouncer в режиме transaction pooling серверные курсоры
+            # (QuerySet.iterator()) не работают — выключаем их
+            "DISABLE_SERVER_SIDE_CURSORS": (
+                os.environ.get("POSTGRESQL_PGBOUNCER", "False") == "True"
+            ),
         }
     }
 else:
@@ -132,6 +166,37 @@ else:
     }
 
 
+# --- Кэш и сессии --------------------------------------------------------
+
+# С Redis (например redis://localhost:6379/1) кэш общий для всех воркеров
+# gunicorn и Celery, и в нём же живут сессии: чтение/запись сессии на каждом
+# запросе идёт в память, а не в таблицу django_session; устаревшие сессии
+# Redis удаляет сам по TTL (= SESSION_COOKIE_AGE).
+# Без Redis (локальная разработка) — файловый кэш, он тоже общий для
+# процессов одной машины; сессии остаются в БД.
+REDIS_URL = os.environ.get("REDIS_URL", "")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+    SESSION_ENGINE = "django.contrib.sessions.backends.cache"
+    SESSION_CACHE_ALIAS = "default"
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get(
+                "DJANGO_CACHE_DIR",
+                os.path.join(tempfile.gettempdir(), "abcp_tender_portal_cache"),
+            ),
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -159,6 +224,24 @@ LOGIN_REDIRECT_URL = 'tender:dashboard' # тоже с неймспейсом
 # Куда редиректить после logout (на будущее)
 LOGOUT_REDIRECT_URL = 'tender:login_step1'
 
+# Лимиты запросов кода 2FA (login_step1): с одного IP и на один e-mail
+# за LOGIN_RATE_PERIOD секунд
+LOGIN_RATE_PERIOD = int(os.environ.get("LOGIN_RATE_PERIOD", "60"))
+LOGIN_RATE_PER_IP = int(os.environ.get("LOGIN_RATE_PER_IP", "5"))
+LOGIN_RATE_PER_EMAIL = int(os.environ.get("LOGIN_RATE_PER_EMAIL", "3"))
+
+# IP клиента за reverse proxy: заголовок, который дописывает прокси, и число
+# доверенных прокси перед Django. По умолчанию 0 — берём REMOTE_ADDR, а
+# заголовку от клиента не доверяем вовсе. За nginx/Timeweb задайте
+# DJANGO_TRUSTED_PROXY_COUNT=1, иначе лимит по IP общий для всех клиентов.
+CLIENT_IP_HEADER = os.environ.get("DJANGO_CLIENT_IP_HEADER", "X-Forwarded-For")
+TRUSTED_PROXY_COUNT = int(os.environ.get("DJANGO_TRUSTED_PROXY_COUNT", "0"))
+
+# messages.error -> класс alert-danger в шаблонах Bootstrap
+MESSAGE_TAGS = {
+    message_constants.ERROR: "danger",
+}
+
 
 
 # Internationalization
@@ -181,6 +264,17 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 # куда collectstatic будет складывать всё перед деплоем
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# collectstatic кладёт рядом .gz/.br и хэширует имена файлов,
+# WhiteNoise отдаёт их с долгим Cache-Control
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -205,7 +299,58 @@ DEFAULT_FROM_EMAIL = os.environ.get(
     EMAIL_HOST_USER or "no-reply@abcp-tender-portal.local",
 )
 
+# --- Celery (фоновая проценка ABCP) --------------------------------------
+
+# Брокер — Redis, например redis://localhost:6379/0.
+# Если CELERY_BROKER_URL не задан (локальная разработка), задачи
+# выполняются синхронно прямо в процессе Django.
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "")
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+
+# Проценка идёт минутами: подтверждаем задачу после выполнения
+# и не даём воркеру набирать задачи впрок
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Предел одной проценки, секунды: дольше воркер её прерывает (time_limit
+# задачи run_abcp_pricing_task), и fail_stale_jobs считает её зависшей
+ABCP_JOB_TIME_LIMIT = int(os.environ.get("ABCP_JOB_TIME_LIMIT", str(3 * 60 * 60)))
 
+# С acks_late Redis возвращает в очередь сообщение, не подтверждённое за
+# visibility_timeout (по умолчанию 1 ч). Он должен быть дольше самой длинной
+# проценки, иначе идущая задача будет доставлена второму воркеру
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "visibility_timeout": ABCP_JOB_TIME_LIMIT + 60 * 60,
+}
+
+# Сколько задач проценки воркер ведёт параллельно (процессов prefork).
+# Внутри каждой задачи ещё ABCP_CONCURRENCY потоков с запросами к API.
+CELERY_WORKER_CONCURRENCY = int(os.environ.get("CELERY_WORKER_CONCURRENCY", "4"))
+
+# Проценка идёт в своей очереди, чтобы длинные задачи не задерживали
+# остальные, письма 2FA — в своей, чтобы сбои SMTP не тормозили проценку
+# (служебные задачи остаются в очереди по умолчанию "celery").
+# Воркер: celery -A abcp_tender_portal worker -Q pricing,email,celery
+CELERY_TASK_ROUTES = {
+    "tender.tasks.run_abcp_pricing_task": {"queue": "pricing"},
+    "tender.tasks.send_2fa_code": {"queue": "email"},
+}
+
+# Периодические задачи (celery -A abcp_tender_portal beat)
+CELERY_BEAT_SCHEDULE = {
+    "purge-login-codes": {
+        "task": "tender.tasks.purge_login_codes",
+        "schedule": 60 * 60,  # раз в час
+    },
+    "purge-result-rows": {
+        "task": "tender.tasks.purge_result_rows",
+        "schedule": 60 * 60,
+    },
+    "fail-stale-jobs": {
+        "task": "tender.tasks.fail_stale_jobs",
+        "schedule": 15 * 60,
+    },
+}
 
 
 LOGGING = {
@@ -1,9 +1,8 @@
 # abcp_tender_portal/urls.py
 
 from django.contrib import admin
-from django.urls import path, include, re_path
+from django.urls import path, include
 from django.conf import settings
-from django.views.static import serve
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -11,6 +10,10 @@ urlpatterns = [
 ]
 
 # --- Раздача static и media ---
+# На Timeweb (DEBUG = False) static отдаёт WhiteNoiseMiddleware.
+# Media наружу не публикуется: входные файлы и результаты отдают
+# view download_input / download_result (только после входа; в проде —
+# через X-Accel-Redirect nginx, см. RESULT_ACCEL_REDIRECT_PREFIX).
 
 if settings.DEBUG:
     # В режиме разработки используем стандартный helper
@@ -18,10 +21,3 @@ if settings.DEBUG:
 
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-else:
-    # На Timeweb (DEBUG = False) статические файлы и media
-    # отдаём через django.views.static.serve
-    urlpatterns += [
-        re_path(r"^static/(?P<path>.*)$", serve, {"document_root": settings.STATIC_ROOT}),
-        re_path(r"^media/(?P<path>.*)$", serve, {"document_root": settings.MEDIA_ROOT}),
-    ]
@@ -8,8 +8,14 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
 import os
+from pathlib import Path
 
-from django.core.wsgi import get_wsgi_application
+from dotenv import load_dotenv
+
+# .env грузим один раз при старте процесса; заданные в окружении переменные важнее
+load_dotenv(Path(__file__).resolve().parent.parent / ".env", override=False)
+
+from django.core.wsgi import get_wsgi_application  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'abcp_tender_portal.settings')
 
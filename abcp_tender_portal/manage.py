@@ -2,10 +2,17 @@
 """Django's command-line utility for administrative tasks."""
 import os
 import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+BASE_DIR = Path(__file__).resolve().parent
 
 
 def main():
     """Run administrative tasks."""
+    # .env грузим один раз при старте; заданные в окружении переменные важнее
+    load_dotenv(BASE_DIR / ".env", override=False)
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'abcp_tender_portal.settings')
     try:
         from django.core.management import execute_from_command_line
@@ -1,4 +1,9 @@
+import os
+
 from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html
+
 from .models import ClientProfile, TenderJob, LoginCode
 
 
@@ -11,14 +16,43 @@ class ClientProfileAdmin(admin.ModelAdmin):
 @admin.register(TenderJob)
 class TenderJobAdmin(admin.ModelAdmin):
     list_display = ("id", "created_at", "created_by", "client_profile", "status")
+    list_select_related = ("created_by", "client_profile")
     list_filter = ("status", "client_profile")
     search_fields = ("id", "client_profile__name", "client_profile__profile_id")
-    readonly_fields = ("created_at",)
+    # MEDIA_ROOT наружу не публикуется, поэтому вместо стандартного виджета
+    # FileField (ссылка на /media/...) показываем ссылки на view скачивания
+    exclude = ("input_file", "result_file")
+    readonly_fields = ("created_at", "input_file_link", "result_file_link", "log_text")
+
+    @admin.display(description="Входной XLSX-файл")
+    def input_file_link(self, obj):
+        if not obj.pk or not obj.input_file:
+            return "—"
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse("tender:download_input", args=[obj.pk]),
+            os.path.basename(obj.input_file.name),
+        )
+
+    @admin.display(description="Результирующий XLSX-файл")
+    def result_file_link(self, obj):
+        if not obj.pk or not obj.result_file:
+            return "—"
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse("tender:download_result", args=[obj.pk]),
+            os.path.basename(obj.result_file.name),
+        )
+
+    @admin.display(description="Лог выполнения (строки)")
+    def log_text(self, obj):
+        return obj.log_text
 
 
 @admin.register(LoginCode)
 class LoginCodeAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "code", "created_at", "is_used")
+    list_select_related = ("user",)
     list_filter = ("is_used", "created_at")
     search_fields = ("user__username", "user__email", "code")
 
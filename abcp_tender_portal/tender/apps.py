@@ -1,6 +1,19 @@
+from pathlib import Path
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class TenderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tender'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (регистрируем обработчики)
+
+        # TemporaryFileUploadHandler не создаёт каталог сам
+        if settings.FILE_UPLOAD_TEMP_DIR:
+            try:
+                Path(settings.FILE_UPLOAD_TEMP_DIR).mkdir(parents=True, exist_ok=True)
+            except OSError:
+                pass
@@ -0,0 +1,20 @@
+"""
+Ключи и таймауты кэша приложения tender.
+
+Отдельный модуль без зависимостей: его импортируют и views/forms, и
+signals (а signals грузятся в AppConfig.ready() для любой команды
+manage.py — тянуть туда views и сервис проценки не нужно).
+"""
+
+# Список профилей для TenderStep1Form меняется редко, а форма строится на
+# каждый GET/POST. Кэш сбрасывается сигналами post_save/post_delete
+# ClientProfile, таймаут страхует процессы, которые сигнал не увидели.
+PROFILE_CHOICES_CACHE_KEY = "tender:client_profile_choices"
+PROFILE_CHOICES_CACHE_TIMEOUT = 300
+
+# Последние задачи для правого блока tender_step1: и сам список, и готовый
+# HTML таблицы ({% cache %} в шаблоне) сбрасываются сигналами на
+# сохранение/удаление TenderJob.
+LAST_JOBS_CACHE_KEY = "tender:last_jobs"
+LAST_JOBS_FRAGMENT = "tender_last_jobs"  # имя фрагмента в tender_step1.html
+LAST_JOBS_CACHE_TIMEOUT = 30
@@ -1,7 +1,30 @@
 from django import forms
+from django.core.cache import cache
+from django.core.validators import FileExtensionValidator
 
+from .cache_keys import PROFILE_CHOICES_CACHE_KEY, PROFILE_CHOICES_CACHE_TIMEOUT
 from .models import ClientProfile
 
+__all__ = ["EmailLoginForm", "CodeConfirmForm", "TenderStep1Form"]
+
+
+def _active_profile_choices() -> list:
+    """
+    Возвращает [(pk, подпись), ...] для выпадающего списка профилей.
+    """
+    choices = cache.get(PROFILE_CHOICES_CACHE_KEY)
+    if choices is None:
+        choices = [
+            (pk, f"{name} (profileId={profile_id})")
+            for pk, name, profile_id in (
+                ClientProfile.objects
+                .order_by("name")
+                .values_list("pk", "name", "profile_id")
+            )
+        ]
+        cache.set(PROFILE_CHOICES_CACHE_KEY, choices, PROFILE_CHOICES_CACHE_TIMEOUT)
+    return choices
+
 
 class EmailLoginForm(forms.Form):
     email = forms.EmailField(
@@ -24,16 +47,31 @@ class TenderStep1Form(forms.Form):
     Форма для Этапа 1: выбор client_profile (profileId) + загрузка XLSX.
     """
 
-    client_profile = forms.ModelChoiceField(
+    client_profile = forms.TypedChoiceField(
         label="Клиентский профиль (profileId)",
-        queryset=ClientProfile.objects.all().order_by("name"),
+        coerce=int,
         help_text="Выберите, под каким клиентским профилем выполнять проценку.",
     )
 
     input_file = forms.FileField(
         label="Входной XLSX-файл",
         help_text="Файл с колонками brand / sku / qty.",
+        validators=[FileExtensionValidator(allowed_extensions=["xls", "xlsx"])],
         widget=forms.ClearableFileInput(
             attrs={"accept": ".xlsx,.xls"}
         ),
     )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["client_profile"].choices = [
+            ("", "---------"),
+            *_active_profile_choices(),
+        ]
+
+    def clean_client_profile(self) -> ClientProfile:
+        # Превращаем pk обратно в объект — один запрос и только при отправке формы
+        try:
+            return ClientProfile.objects.get(pk=self.cleaned_data["client_profile"])
+        except ClientProfile.DoesNotExist:
+            raise forms.ValidationError("Выбранный профиль больше не существует.")
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-14 11:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tender', '0004_alter_tenderjob_options'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='logincode',
+            index=models.Index(fields=['user', 'is_used', '-created_at'], name='lc_user_active'),
+        ),
+        migrations.AddIndex(
+            model_name='tenderjob',
+            index=models.Index(fields=['-created_at'], name='tj_created_desc'),
+        ),
+        migrations.AddIndex(
+            model_name='tenderjob',
+            index=models.Index(fields=['status', '-created_at'], name='tj_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='tenderjob',
+            index=models.Index(fields=['client_profile', '-created_at'], name='tj_profile_created'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-14 11:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tender', '0005_logincode_lc_user_active_tenderjob_tj_created_desc_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveIntegerField(verbose_name='Номер строки')),
+                ('ts', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время')),
+                ('message', models.TextField(verbose_name='Сообщение')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_entries', to='tender.tenderjob', verbose_name='Задача')),
+            ],
+            options={
+                'verbose_name': 'Строка лога',
+                'verbose_name_plural': 'Строки лога',
+                'ordering': ['seq'],
+                'unique_together': {('job', 'seq')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-14 11:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tender', '0006_joblogentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tenderjob',
+            name='client_profile',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='tender_jobs', to='tender.clientprofile', verbose_name='Профиль клиента'),
+        ),
+        migrations.AlterField(
+            model_name='tenderjob',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tender_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+    ]
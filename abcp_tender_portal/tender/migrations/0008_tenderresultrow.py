@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-14 11:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tender', '0007_alter_tenderjob_client_profile_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenderResultRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(verbose_name='Номер строки')),
+                ('values', models.JSONField(verbose_name='Значения')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='result_rows', to='tender.tenderjob', verbose_name='Задача')),
+            ],
+            options={
+                'verbose_name': 'Строка результата',
+                'verbose_name_plural': 'Строки результата',
+                'ordering': ['position'],
+                'unique_together': {('job', 'position')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-14 11:46
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Функциональный индекс LOWER(email) на auth_user: login_step1 ищет
+    пользователя по LOWER(email) = %s, без индекса это полный проход таблицы.
+    Модель User не наша (django.contrib.auth), поэтому индекс создаём SQL-ом.
+    """
+
+    dependencies = [
+        ('tender', '0008_tenderresultrow'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS user_email_lower_idx ON auth_user (LOWER(email));',
+            reverse_sql='DROP INDEX IF EXISTS user_email_lower_idx;',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-14 11:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tender', '0009_user_email_lower_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='logincode',
+            name='lc_user_active',
+        ),
+        migrations.AddIndex(
+            model_name='logincode',
+            index=models.Index(fields=['user', 'code', 'is_used', '-created_at'], name='logincode_lookup_idx'),
+        ),
+    ]
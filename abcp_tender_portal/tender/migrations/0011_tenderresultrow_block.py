@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-14 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tender', '0010_logincode_lookup_idx'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='tenderresultrow',
+            options={'ordering': ['block', 'position'], 'verbose_name': 'Строка результата', 'verbose_name_plural': 'Строки результата'},
+        ),
+        migrations.AlterUniqueTogether(
+            name='tenderresultrow',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='tenderresultrow',
+            name='block',
+            field=models.PositiveIntegerField(default=0, verbose_name='Номер блока'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tenderresultrow',
+            unique_together={('job', 'block', 'position')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-14 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tender', '0011_tenderresultrow_block'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenderjob',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Начало обработки'),
+        ),
+    ]
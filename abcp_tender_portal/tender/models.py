@@ -1,6 +1,9 @@
+from datetime import timedelta
+
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -16,9 +19,6 @@ class ClientProfile(models.Model):
     def __str__(self):
         return f"{self.name} (profileId={self.profile_id})"
 
-from django.conf import settings
-from django.db import models
-
 
 class TenderJob(models.Model):
     # ✅ 1. Статусы задачи
@@ -43,21 +43,33 @@ class TenderJob(models.Model):
 
     # ✅ 2. КТО и КОГДА создал задачу
     created_at = models.DateTimeField(auto_now_add=True)
+    # SET_NULL: удаление пользователя не должно стирать историю проценок
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
         related_name="tender_jobs",
         verbose_name="Пользователь",
     )
 
     # ✅ 3. Профиль клиента (profileId)
+    # PROTECT: профиль, по которому есть задачи, удалить нельзя
     client_profile = models.ForeignKey(
         "ClientProfile",
-        on_delete=models.CASCADE,
+        on_delete=models.PROTECT,
         related_name="tender_jobs",
         verbose_name="Профиль клиента",
     )
 
+    # Когда воркер взял задачу в работу: по нему fail_stale_jobs
+    # находит зависшие проценки (created_at включает время в очереди)
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Начало обработки",
+    )
+
     # ✅ 4. Текущий статус
     status = models.CharField(
         max_length=20,
@@ -80,7 +92,8 @@ class TenderJob(models.Model):
         verbose_name="Результирующий XLSX-файл",
     )
 
-    # ✅ 7. Лог выполнения задачи (сюда пишет run_abcp_pricing)
+    # ✅ 7. Лог выполнения задачи — устаревшее поле, новые строки лога
+    # пишутся в JobLogEntry; поле оставлено для чтения логов старых задач
     log = models.TextField(
         blank=True,
         default="",
@@ -91,19 +104,158 @@ class TenderJob(models.Model):
         verbose_name = "Задача проценки"
         verbose_name_plural = "Задачи проценки"
         ordering = ["-created_at"]
+        # под ordering, list_filter админки и списки последних задач
+        indexes = [
+            models.Index(fields=["-created_at"], name="tj_created_desc"),
+            models.Index(fields=["status", "-created_at"], name="tj_status_created"),
+            models.Index(fields=["client_profile", "-created_at"], name="tj_profile_created"),
+        ]
 
     def __str__(self) -> str:
         return f"Задача #{self.pk} ({self.get_status_display()})"
 
+    @property
+    def log_text(self) -> str:
+        """
+        Полный лог задачи: строки JobLogEntry по порядку,
+        а для старых задач — содержимое поля log.
+        Использует log_entries.all(), поэтому работает с prefetch_related.
+        """
+        lines = [entry.message for entry in self.log_entries.all()]
+        if lines:
+            return "\n".join(lines)
+        return self.log
+
+    @property
+    def last_log_line(self) -> str:
+        """
+        Последняя строка лога (у упавшей задачи — причина ошибки) для списков
+        задач: весь лог, как log_text, не собирает (log_text — для админки).
+        Берёт last_log_entries, если их подгрузил Prefetch (см. views._last_jobs),
+        иначе одним запросом последнюю строку JobLogEntry. Старое поле log
+        читаем, только если оно не отложено (.only/.defer), чтобы не делать
+        лишний запрос на каждую задачу списка.
+        """
+        entries = getattr(self, "last_log_entries", None)
+        if entries is None:
+            entries = list(self.log_entries.order_by("-seq").only("message")[:1])
+        if entries:
+            return entries[0].message
+        if "log" in self.get_deferred_fields():
+            return ""
+        lines = self.log.strip().splitlines()
+        return lines[-1] if lines else ""
+
+
+class JobLogEntry(models.Model):
+    """
+    Строка лога задачи проценки.
+    Лог растёт вставкой новых строк, а не перезаписью одного TextField.
+    """
+    job = models.ForeignKey(
+        TenderJob,
+        on_delete=models.CASCADE,
+        related_name="log_entries",
+        verbose_name="Задача",
+    )
+    seq = models.PositiveIntegerField("Номер строки")
+    ts = models.DateTimeField("Время", default=timezone.now)
+    message = models.TextField("Сообщение")
+
+    class Meta:
+        verbose_name = "Строка лога"
+        verbose_name_plural = "Строки лога"
+        ordering = ["seq"]
+        # уникальность (job, seq) заодно даёт индекс для выборки лога задачи
+        unique_together = ("job", "seq")
+
+    def __str__(self) -> str:
+        return f"#{self.job_id}.{self.seq}: {self.message[:50]}"
+
+
+class TenderResultRow(models.Model):
+    """
+    Строка листа Data результата проценки — промежуточное хранение, пока
+    собирается XLSX: блоки строк пишутся по мере прихода ответов ABCP,
+    затем XLSX выгружается отсюда потоково (order by block, position),
+    и строки задачи удаляются.
+    block — номер блока (запрашиваемые бренд+артикул) в порядке листа,
+    position — номер строки внутри блока.
+    values — значения ячеек списком в порядке колонок FINAL_COLS
+    (services/abcp_step1.py), числа остаются числами.
+    """
+    job = models.ForeignKey(
+        TenderJob,
+        on_delete=models.CASCADE,
+        related_name="result_rows",
+        verbose_name="Задача",
+    )
+    block = models.PositiveIntegerField("Номер блока", default=0)
+    position = models.PositiveIntegerField("Номер строки")
+    values = models.JSONField("Значения")
+
+    class Meta:
+        verbose_name = "Строка результата"
+        verbose_name_plural = "Строки результата"
+        ordering = ["block", "position"]
+        # уникальность (job, block, position) заодно даёт индекс для выгрузки по порядку
+        unique_together = ("job", "block", "position")
+
+    def __str__(self) -> str:
+        return f"#{self.job_id}.{self.block}.{self.position}"
+
 class LoginCode(models.Model):
     """
     Таблица одноразовых кодов для 2FA (логин по email + код).
     """
+    # код живёт 15 минут (так и написано в письме)
+    TTL = timedelta(minutes=15)
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="login_codes")
     code = models.CharField(max_length=6)
     created_at = models.DateTimeField(auto_now_add=True)
     is_used = models.BooleanField(default=False)
 
+    class Meta:
+        # гашение кода (consume): user=X, code=Y, is_used=False,
+        # created_at >= ..., order by -created_at limit 1
+        indexes = [
+            models.Index(
+                fields=["user", "code", "is_used", "-created_at"],
+                name="logincode_lookup_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"Code {self.code} for {self.user}"
 
+    @staticmethod
+    def cache_key(user_id: int) -> str:
+        """
+        Ключ кэша с действующим кодом пользователя. Проверка кода при входе
+        идёт по кэшу (TTL = LoginCode.TTL), таблица остаётся журналом.
+        """
+        return f"2fa:{user_id}"
+
+    @classmethod
+    def consume(cls, user, code: str) -> bool:
+        """
+        Гасит последний действующий код пользователя, если он совпал.
+
+        Один запрос: UPDATE ... WHERE id IN (SELECT id ... ORDER BY created_at
+        DESC LIMIT 1) — под индекс logincode_lookup_idx. Возвращает True, если код
+        был верный, не использованный и не просроченный.
+        """
+        latest = (
+            cls.objects
+            .filter(
+                user=user,
+                code=code,
+                is_used=False,
+                created_at__gte=timezone.now() - cls.TTL,
+            )
+            .order_by("-created_at")
+            .values("pk")[:1]
+        )
+        return bool(cls.objects.filter(pk__in=latest, is_used=False).update(is_used=True))
+
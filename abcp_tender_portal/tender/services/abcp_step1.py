@@ -1,74 +1,305 @@
 # tender/services/abcp_step1.py
 
+import hashlib
 import logging
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
+import numpy as np
+import orjson
 import pandas as pd
 import requests
+import xlsxwriter
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
-from dotenv import load_dotenv
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
 
-from ..models import TenderJob
+from ..models import JobLogEntry, TenderJob, TenderResultRow
+from ..signals import reset_last_jobs_cache
 
 logger = logging.getLogger(__name__)
 
-# ----------------------- Загрузка .env и конфиг -----------------------
+# ----------------------- Конфиг ABCP -----------------------
 
-# Явно грузим .env из BASE_DIR
-load_dotenv(os.path.join(settings.BASE_DIR, ".env"))
+# .env загружается один раз при старте процесса (manage.py, wsgi.py,
+# asgi.py, celery.py), здесь только читаем переменные окружения
 
-_raw_host = os.getenv("ABCP_HOST", "").strip()
-# подстрахуемся: если забыли схему — считаем, что https
-if _raw_host and not _raw_host.startswith(("http://", "https://")):
-    _raw_host = "https://" + _raw_host
 
-ABCP_HOST = _raw_host.rstrip("/")
-ABCP_USERLOGIN = os.getenv("ABCP_USERLOGIN", "")
-# В ABCP обычно ожидается md5 пароля; считаем, что в .env уже лежит нужное значение
-ABCP_USERPSW = os.getenv("ABCP_USERPSW", "")
+@dataclass(frozen=True)
+class AbcpConfig:
+    """Параметры доступа к API ABCP."""
 
+    host: str
+    login: str
+    psw: str
 
-def _append_log(job: TenderJob, message: str) -> None:
+    @property
+    def missing(self) -> List[str]:
+        """Имена незаполненных переменных окружения."""
+        return [
+            name
+            for name, value in (
+                ("ABCP_HOST", self.host),
+                ("ABCP_USERLOGIN", self.login),
+                ("ABCP_USERPSW", self.psw),
+            )
+            if not value
+        ]
+
+
+@lru_cache(maxsize=1)
+def _abcp_config() -> AbcpConfig:
+    """
+    Читает параметры API ABCP из переменных окружения.
+    Кэшируется на процесс; в тестах сбрасывается через _abcp_config.cache_clear().
+    """
+    host = os.getenv("ABCP_HOST", "").strip()
+    # подстрахуемся: если забыли схему — считаем, что https
+    if host and not host.startswith(("http://", "https://")):
+        host = "https://" + host
+
+    # В ABCP обычно ожидается md5 пароля; считаем, что в .env уже лежит нужное значение
+    return AbcpConfig(
+        host=host.rstrip("/"),
+        login=os.getenv("ABCP_USERLOGIN", ""),
+        psw=os.getenv("ABCP_USERPSW", ""),
+    )
+
+
+# Проверяем конфиг один раз при импорте: предупреждение в лог процесса,
+# задачи при этом сами завершатся с ошибкой в _ensure_env
+if _abcp_config().missing:
+    logger.warning(
+        "ABCP не настроен, не заданы переменные окружения: %s",
+        ", ".join(_abcp_config().missing),
+    )
+
+
+# Одна HTTP-сессия на процесс: TCP+TLS соединения с ABCP переиспользуются
+# (keep-alive) между запросами задачи и между задачами воркера.
+# Пул не меньше числа потоков с запросами (ABCP_CONCURRENCY): иначе лишние
+# соединения закрываются после ответа и следующий запрос снова делает
+# TLS-рукопожатие. Временные ошибки и 429 повторяем с нарастающей паузой.
+_HTTP_POOL_SIZE = max(32, int(os.getenv("ABCP_CONCURRENCY", "16")))
+_RETRY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=[429, 500, 502, 503, 504],
+)
+SESSION = requests.Session()
+for _scheme in ("https://", "http://"):
+    SESSION.mount(
+        _scheme,
+        HTTPAdapter(pool_connections=4, pool_maxsize=_HTTP_POOL_SIZE, max_retries=_RETRY),
+    )
+
+# Каталог результатов: MEDIA_ROOT/tenders/output/, создаём один раз при импорте
+_MEDIA_ROOT = Path(settings.MEDIA_ROOT)
+_OUTPUT_DIR = _MEDIA_ROOT / "tenders" / "output"
+try:
+    _OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+except OSError as exc:
+    # например, MEDIA_ROOT только для чтения в тестовом окружении
+    logger.warning("Не удалось создать каталог результатов %s: %r", _OUTPUT_DIR, exc)
+
+
+class _JobLogger:
+    """
+    Лог задачи с буферизацией.
+
+    Сообщения сразу уходят в logger, а в БД (JobLogEntry) записываются
+    пачкой через bulk_create: когда буфер превысил FLUSH_SIZE символов,
+    прошло FLUSH_INTERVAL секунд, на контрольных точках проценки (явный
+    flush()) или при выходе из блока with.
+    Каждая строка — отдельная вставка, уже записанный лог не перезаписывается.
+    Буфер защищён блокировкой: info() можно вызывать из потоков пула.
+    """
+
+    FLUSH_SIZE = 4096
+    FLUSH_INTERVAL = 2.0  # секунды
+
+    def __init__(self, job: TenderJob) -> None:
+        self.job = job
+        self._lock = threading.RLock()
+        self._buf: List[JobLogEntry] = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+        # продолжаем нумерацию, если у задачи уже есть строки лога
+        self._seq = job.log_entries.aggregate(last=Max("seq"))["last"] or 0
+
+    def __enter__(self) -> "_JobLogger":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.flush()
+
+    def info(self, message: str) -> None:
+        logger.info(message)
+        with self._lock:
+            self._seq += 1
+            self._buf.append(
+                JobLogEntry(job=self.job, seq=self._seq, ts=timezone.now(), message=message)
+            )
+            self._size += len(message)
+            if (
+                self._size >= self.FLUSH_SIZE
+                or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL
+            ):
+                self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._buf:
+                return
+
+            batch, self._buf, self._size = self._buf, [], 0
+            JobLogEntry.objects.bulk_create(batch, batch_size=500)
+
+
+def _build_result_path(job: TenderJob) -> Path:
+    """Путь к XLSX с результатом проценки задачи."""
+    return _OUTPUT_DIR / f"abcp_tender_search_job_{job.id}.xlsx"
+
+
+def _set_status(jl: _JobLogger, status: str, *extra_fields: str) -> None:
     """
-    Пишет сообщение в logger и в job.log + сохраняет задачу.
-    Сохраняем все поля job (без update_fields), чтобы обновления статуса/файла
-    точно попали в БД.
+    Меняет статус задачи и сохраняет только изменённые поля.
+    Перед сменой статуса дописываем накопленный лог, чтобы пользователь
+    увидел причину ошибки вместе со статусом.
     """
-    logger.info(message)
-    job.log = (job.log or "") + message + "\n"
-    job.save()
+    jl.flush()
+    job = jl.job
+    job.status = status
+    job.save(update_fields=["status", *extra_fields])
 
 
-def _ensure_env(job: TenderJob) -> bool:
+def mark_job_failed(job: TenderJob, message: str) -> None:
+    """
+    Пишет причину в лог задачи и ставит статус "Ошибка".
+    Для сбоев вне run_abcp_pricing: задачу не удалось поставить в очередь,
+    проценка упала с необработанным исключением или задача потерялась.
+    """
+    with _JobLogger(job) as jl:
+        jl.info(message)
+        _set_status(jl, TenderJob.STATUS_ERROR)
+
+
+def _ensure_env(jl: _JobLogger) -> bool:
     """
     Проверяем, что заполнены переменные окружения для ABCP.
     Если чего-то нет — пишем в лог job и возвращаем False.
     """
-    missing = []
-    if not ABCP_HOST:
-        missing.append("ABCP_HOST")
-    if not ABCP_USERLOGIN:
-        missing.append("ABCP_USERLOGIN")
-    if not ABCP_USERPSW:
-        missing.append("ABCP_USERPSW")
-
+    missing = _abcp_config().missing
     if missing:
-        job.status = TenderJob.STATUS_ERROR
-        _append_log(
-            job,
+        jl.info(
             "Ошибка конфигурации ABCP: отсутствуют переменные окружения: "
             + ", ".join(missing),
         )
+        _set_status(jl, TenderJob.STATUS_ERROR)
         return False
 
     return True
 
 
+# ----------------------- Чтение входного файла -----------------------
+
+# Файлы больше этого размера читаем потоково через openpyxl (read_only),
+# чтобы не держать в памяти всю книгу целиком
+XLSX_STREAMING_THRESHOLD = 50 * 1024 * 1024
+
+
+def _read_input_xlsx(path: Path) -> pd.DataFrame:
+    """
+    Читает первый лист входного XLSX в DataFrame (первая строка — заголовки).
+
+    Обычные файлы читаем через python-calamine (разбор XLSX в нативном коде),
+    если он не установлен — через openpyxl. Очень большие файлы читаем
+    openpyxl в режиме read_only, построчно собирая кортежи значений.
+
+    Все значения читаем строками (пустые ячейки — NaN): нужны только
+    бренд/артикул/qty, и pandas не тратит время на вывод типов колонок.
+    """
+    if path.stat().st_size <= XLSX_STREAMING_THRESHOLD:
+        try:
+            return pd.read_excel(path, engine="calamine", dtype=str)
+        except ImportError:
+            logger.warning("python-calamine не установлен, читаем XLSX через openpyxl")
+            return pd.read_excel(path, engine="openpyxl", dtype=str)
+
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        records = [
+            tuple(None if v is None else str(v) for v in row)
+            for row in rows
+            if any(v is not None for v in row)
+        ]
+    finally:
+        wb.close()
+
+    return pd.DataFrame.from_records(records, columns=list(header))
+
+
 # ----------------------- Вспомогательные функции API -----------------------
 
+# Регулярки компилируем один раз: они вызываются на каждую позицию ответа
+_RE_TAG = re.compile(r"<[^>]+>")
+_RE_WS = re.compile(r"\s+")
+_RE_NORM = re.compile(r"[\s\-./]")
+_RE_TRAIL_PAREN = re.compile(r"\s*\([^()]*\)\s*$")
+
+
+def _clean_html(s: pd.Series) -> pd.Series:
+    """Убирает HTML-разметку типа <span>...</span><br> и лишние пробелы по всей колонке."""
+    return (
+        s.astype(str)
+        .str.replace(_RE_TAG, " ", regex=True)
+        .str.replace(_RE_WS, " ", regex=True)
+        .str.strip()
+    )
+
+
+def _first_truthy(raw: pd.DataFrame, names: List[str], default="") -> pd.Series:
+    """
+    Векторный аналог item.get(a) or item.get(b) or ... or default:
+    для каждой строки берём первое непустое (не None/NaN, не "" и не 0) поле.
+    Отсутствующие в ответе поля пропускаем.
+    """
+    result = pd.Series(default, index=raw.index, dtype=object)
+    for name in reversed(names):
+        if name not in raw.columns:
+            continue
+        col = raw[name]
+        result = col.where(col.notna() & col.ne("") & col.ne(0), result)
+    return result
+
+
+
+def _keywords_re(*keywords: str) -> "re.Pattern[str]":
+    """Регулярка «заголовок содержит любое из слов», без учёта регистра."""
+    return re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+
+
+_BRAND_COL_RE = _keywords_re("бренд", "brand", "производитель")
+_ARTICLE_COL_RE = _keywords_re("артикул", "article", "код", "номер", "sku")
+_QTY_COL_RE = _keywords_re("qty", "кол-во", "количество", "quantity")
+
 
 def detect_columns(df: pd.DataFrame) -> Tuple[str, str, Optional[str]]:
     """
@@ -76,34 +307,14 @@ def detect_columns(df: pd.DataFrame) -> Tuple[str, str, Optional[str]]:
       - бренд
       - артикул
       - количество (qty) — опционально
+    Берётся первая колонка, в заголовке которой встречается одно из слов.
     """
-    lower_cols = {col: str(col).lower().strip() for col in df.columns}
-
-    brand_col = next(
-        (
-            col
-            for col, lc in lower_cols.items()
-            if any(k in lc for k in ["бренд", "brand", "производитель"])
-        ),
-        None,
-    )
-    article_col = next(
-        (
-            col
-            for col, lc in lower_cols.items()
-            if any(k in lc for k in ["артикул", "article", "код", "номер", "sku"])
-        ),
-        None,
-    )
+    def find(pattern: "re.Pattern[str]") -> Optional[str]:
+        return next((col for col in df.columns if pattern.search(str(col))), None)
 
-    qty_col = next(
-        (
-            col
-            for col, lc in lower_cols.items()
-            if any(k in lc for k in ["qty", "кол-во", "количество", "quantity"])
-        ),
-        None,
-    )
+    brand_col = find(_BRAND_COL_RE)
+    article_col = find(_ARTICLE_COL_RE)
+    qty_col = find(_QTY_COL_RE)
 
     if not brand_col or not article_col:
         raise RuntimeError("Не удалось определить колонки для бренда и артикула")
@@ -140,145 +351,92 @@ def build_search_params(
     return params
 
 
-def extract_stock_name(item: dict) -> str:
-    """
-    Пытается вытащить название/идентификатор склада из ответа по позиции.
-
-    По данным техподдержки ABCP, название склада — это название маршрута
-    поставщика в поле supplierDescription. Оно может содержать HTML-теги,
-    поэтому мы их вычищаем.
-    """
-    raw = (
-        item.get("officeName")
-        or item.get("stockName")
-        or item.get("warehouseName")
-        or item.get("storageName")
-        or item.get("deliveryOffice")
-        or item.get("supplierDescription")  # главное поле
-    )
-
-    if not raw:
-        logger.debug(
-            "Склад НЕ найден в позиции %s %s. Ключи: %s",
-            item.get("brand"),
-            item.get("number"),
-            list(item.keys()),
-        )
-        return ""
-
-    # Убираем HTML-разметку типа <span>...</span><br> и лишние пробелы
-    cleaned = re.sub(r"<[^>]+>", " ", str(raw))
-    cleaned = re.sub(r"\s+", " ", cleaned).strip()
-
-    logger.debug(
-        "Склад найден для %s %s: %s",
-        item.get("brand"),
-        item.get("number"),
-        cleaned,
-    )
-    return cleaned
-
-
-def extract_deadline_text(item: dict) -> str:
-    """
-    Возвращает человекочитаемый срок поставки по позиции.
-
-    Логика:
-    - если есть непустой deadlineReplace — используем его;
-    - иначе считаем, что это режим «на складе».
-    """
-    raw = item.get("deadlineReplace")
-    if raw:
-        cleaned = re.sub(r"<[^>]+>", " ", str(raw))
-        cleaned = re.sub(r"\s+", " ", cleaned).strip()
-        if cleaned:
-            return cleaned
-
-    return "на складе"
+# Список поставщиков меняется редко: держим его в кэше Django час,
+# а последнюю удачную копию — сутки, на случай если ABCP недоступен
+DISTRIBUTORS_CACHE_TTL = 60 * 60
+DISTRIBUTORS_STALE_TTL = 24 * 60 * 60
 
 
-def extract_supplier_name(item: dict) -> str:
+def _fetch_distributors_map(host: str, login: str, psw: str) -> Optional[Dict[int, str]]:
     """
-    Возвращает код/ID поставщика для колонки 'Поставщик'.
-
-    Сейчас используем:
-    - distributorCode, если он задан (можно настроить в АВСР
-      как человекочитаемый код/имя);
-    - иначе подставляем distributorId как строку.
+    Запрос cp/distributors. Возвращает словарь {id: название}
+    или None, если запрос не удался.
     """
-    name = item.get("distributorCode")
-    if name:
-        return str(name)
+    url = host + "/cp/distributors"
+    params = {
+        "userlogin": login,
+        "userpsw": psw,
+    }
 
-    dist_id = item.get("distributorId")
-    if dist_id is not None:
-        return str(dist_id)
+    try:
+        r = SESSION.get(url, params=params, timeout=30)
+        r.raise_for_status()
+        data = orjson.loads(r.content)
+    except Exception as exc:
+        logger.error("Ошибка при запросе cp/distributors: %r", exc)
+        return None
 
-    return ""
+    if not isinstance(data, list):
+        logger.warning("Неожиданный формат ответа cp/distributors: %s", type(data))
+        return None
 
+    result: Dict[int, str] = {}
+    for row in data:
+        try:
+            dist_id = row.get("id")
+            if dist_id is None:
+                continue
 
-def extract_supplier_full_name(item: dict, distributors_map: Dict[int, str]) -> str:
-    """
-    Возвращает полное название поставщика (для колонки 'Название поставщика')
-    по distributorId через заранее загруженный словарь cp/distributors.
-    """
-    dist_id = item.get("distributorId")
-    if dist_id is None:
-        return ""
+            name = row.get("publicName") or row.get("name") or str(dist_id)
+            result[int(dist_id)] = str(name)
+        except Exception:
+            # не валим весь список из-за одной кривой записи
+            continue
 
-    try:
-        return distributors_map.get(int(dist_id), "") or ""
-    except Exception:
-        return ""
+    logger.info("Загружено поставщиков из cp/distributors: %s", len(result))
+    return result
 
 
 def load_distributors_map() -> Dict[int, str]:
     """
-    Загружает список поставщиков через cp/distributors
-    и возвращает словарь {id: человекочитаемое_название}.
-    Берём publicName, если он есть, иначе name.
+    Возвращает словарь поставщиков {id: человекочитаемое_название}
+    (publicName, если он есть, иначе name).
+
+    Список берётся из кэша Django (ключ — хост и логин ABCP), в ABCP
+    ходим не чаще раза в DISTRIBUTORS_CACHE_TTL. Если запрос не удался,
+    отдаём последнюю удачную копию, а если её нет — пустой словарь.
     """
-    if not ABCP_HOST or not ABCP_USERLOGIN or not ABCP_USERPSW:
+    cfg = _abcp_config()
+    if cfg.missing:
         logger.warning(
             "Невозможно загрузить cp/distributors: не заданы ABCP_HOST/USERLOGIN/USERPSW"
         )
         return {}
+    host, login, psw = cfg.host, cfg.login, cfg.psw
 
-    url = ABCP_HOST.rstrip("/") + "/cp/distributors"
-    params = {
-        "userlogin": ABCP_USERLOGIN,
-        "userpsw": ABCP_USERPSW,
-    }
+    digest = hashlib.md5((host + login).encode("utf-8")).hexdigest()
+    key = f"abcp:distributors:{digest}"
+    stale_key = f"{key}:stale"
 
-    try:
-        r = requests.get(url, params=params, timeout=30)
-        r.raise_for_status()
-        data = r.json()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
 
-        if not isinstance(data, list):
-            logger.warning("Неожиданный формат ответа cp/distributors: %s", type(data))
-            return {}
-
-        result: Dict[int, str] = {}
-        for row in data:
-            try:
-                dist_id = row.get("id")
-                if dist_id is None:
-                    continue
-
-                name = row.get("publicName") or row.get("name") or str(dist_id)
-                result[int(dist_id)] = str(name)
-            except Exception:
-                # не валим весь список из-за одной кривой записи
-                continue
-
-        logger.info("Загружено поставщиков из cp/distributors: %s", len(result))
-        return result
-
-    except Exception as exc:
-        logger.error("Ошибка при запросе cp/distributors: %r", exc)
+    result = _fetch_distributors_map(host, login, psw)
+    if result is None:
+        stale = cache.get(stale_key)
+        if stale is not None:
+            logger.warning(
+                "cp/distributors недоступен, используем сохранённый список (%s)",
+                len(stale),
+            )
+            return stale
         return {}
 
+    cache.set(key, result, DISTRIBUTORS_CACHE_TTL)
+    cache.set(stale_key, result, DISTRIBUTORS_STALE_TTL)
+    return result
+
 
 def call_search_articles(
     host: str,
@@ -296,9 +454,9 @@ def call_search_articles(
     params = build_search_params(login, psw, brand, article, profile_id)
 
     try:
-        r = requests.get(url, params=params, timeout=30)
+        r = SESSION.get(url, params=params, timeout=30)
         r.raise_for_status()
-        data = r.json()
+        data = orjson.loads(r.content)
         if isinstance(data, dict) and "errorCode" in data:
             logger.warning("API ошибка %s для %s %s", data, brand, article)
             return []
@@ -319,7 +477,13 @@ def call_search_articles(
 def normalize_article(s: str) -> str:
     """Нормализация артикула/бренда: upper, без пробелов, тире, точек и слэшей."""
     s = str(s or "").upper()
-    return re.sub(r"[\s\-./]", "", s)
+    return _RE_NORM.sub("", s)
+
+
+def _norm_series(s: pd.Series) -> pd.Series:
+    """То же, что normalize_article, но сразу для всей колонки."""
+    return s.fillna("").astype(str).str.upper().str.replace(_RE_NORM, "", regex=True)
+
 
 def format_profile_name(raw: str) -> str:
     """
@@ -332,319 +496,494 @@ def format_profile_name(raw: str) -> str:
         return ""
     text = str(raw).strip()
     # убираем последнее " ( ... )" в конце строки
-    cleaned = re.sub(r"\s*\([^()]*\)\s*$", "", text).strip()
+    cleaned = _RE_TRAIL_PAREN.sub("", text).strip()
     return cleaned or text
 
 
 
-def extract_row_from_item(
-    item: dict,
-    profile_id: str,
-    rq_brand: str,
-    rq_article: str,
-    rq_qty,
+# Колонки листа Data в порядке вывода
+FINAL_COLS = (
+    "Запрашиваемый бренд",
+    "Запрашиваемый артикул",
+    "Группа результата",
+    "Бренд",
+    "Артикул",
+    "Описание",
+    "Запрашиваемое кол-во",
+    "Наличие",
+    "Цена по профилю",
+    "Срок",
+    "Склад",
+    "Поставщик",
+    "Название поставщика",
+    "Расчет по профилю клиента",
+)
+
+# Колонки листа Errors
+ERROR_COLS = (
+    "Запрашиваемый бренд",
+    "Запрашиваемый артикул",
+    "Запрашиваемое кол-во",
+    "Комментарий",
+)
+
+
+def build_data_frame(
+    records: List[dict],
+    profile_label: str,
     distributors_map: Dict[int, str],
-) -> Dict[str, str]:
-    """Формирует строку для листа Data."""
-    stock_name = extract_stock_name(item)
-    deadline_text = extract_deadline_text(item)
-    supplier_name = extract_supplier_name(item)
-    supplier_full_name = extract_supplier_full_name(item, distributors_map)
-
-    return {
-        "Запрашиваемый бренд": rq_brand,
-        "Запрашиваемый артикул": rq_article,
-        "Бренд": item.get("brand") or item.get("brandFix") or rq_brand,
-        "Артикул": item.get("number") or item.get("numberFix") or rq_article,
-        "Описание": item.get("description") or "",
-        "Запрашиваемое кол-во": rq_qty if rq_qty is not None else "",
-        "Наличие": (
-            item.get("availability")
-            or item.get("rest")
-            or item.get("qty")
-            or ""
-        ),
-        "Расчет по профилю клиента": profile_id,
-        "Поставщик": supplier_name,              # код/ID поставщика
-        "Склад": stock_name,
-        "Название поставщика": supplier_full_name,  # полное имя из cp/distributors
-        "Срок": deadline_text,
-        "Цена по профилю": (
-            item.get("price")
-            or item.get("priceOut")
-            or item.get("priceInSiteCurrency")
-            or ""
-        ),
-    }
+) -> pd.DataFrame:
+    """
+    Формирует лист Data из всех позиций ответов ABCP разом.
 
+    records — позиции search/articles, в каждую добавлены поля запроса
+    __rq_brand, __rq_article и __rq_qty. Колонки считаются операциями
+    над целыми столбцами, а не по одной позиции.
+    """
+    raw = pd.DataFrame(records, dtype=object)
 
-# ----------------------------- Основная логика -----------------------------
+    # Склад — название маршрута поставщика (supplierDescription по данным
+    # техподдержки ABCP), может содержать HTML-теги
+    stock = _clean_html(
+        _first_truthy(
+            raw,
+            [
+                "officeName",
+                "stockName",
+                "warehouseName",
+                "storageName",
+                "deliveryOffice",
+                "supplierDescription",  # главное поле
+            ],
+        )
+    )
 
+    # Срок: непустой deadlineReplace, иначе считаем, что это режим «на складе»
+    deadline = _clean_html(_first_truthy(raw, ["deadlineReplace"]))
+    deadline = deadline.where(deadline != "", "на складе")
 
-def run_abcp_pricing(job: TenderJob) -> None:
-    """
-    Основная функция Этапа 1.
+    # Поставщик: distributorCode, если он задан (можно настроить в АВСР как
+    # человекочитаемый код/имя), иначе distributorId как строка
+    if "distributorId" in raw.columns:
+        dist_id = raw["distributorId"]
+    else:
+        dist_id = pd.Series(None, index=raw.index, dtype=object)
+    supplier = _first_truthy(raw, ["distributorCode"], default=None)
+    supplier = supplier.astype(str).where(
+        supplier.notna(), dist_id.astype(str).where(dist_id.notna(), "")
+    )
 
-    Что делает:
-      1. Проверяет .env (ABCP_HOST, ABCP_USERLOGIN, ABCP_USERPSW).
-      2. Читает входной XLSX из job.input_file.
-      3. Определяет колонки бренд / артикул / qty.
-      4. Загружает список поставщиков (cp/distributors).
-      5. Формирует уникальные пары (brand, article, qty) и по каждой
-         вызывает ABCP /search/articles/.
-      6. Собирает результаты в два DataFrame:
-         - Data (предложения)
-         - Errors (по каким запросам ничего не найдено / ошибка API).
-      7. Сохраняет результат в Excel:
-         MEDIA_ROOT / "tenders/output/abcp_tender_search_job_<id>.xlsx"
-         (листы Data и Errors).
-      8. Обновляет job.result_file, job.status и job.log.
+    # Название поставщика — по distributorId через словарь cp/distributors
+    supplier_full = (
+        pd.to_numeric(dist_id, errors="coerce").map(distributors_map).fillna("")
+    )
+
+    return pd.DataFrame(
+        {
+            "Запрашиваемый бренд": raw["__rq_brand"],
+            "Запрашиваемый артикул": raw["__rq_article"],
+            "Бренд": _first_truthy(raw, ["brand", "brandFix", "__rq_brand"]),
+            "Артикул": _first_truthy(raw, ["number", "numberFix", "__rq_article"]),
+            "Описание": _first_truthy(raw, ["description"]),
+            "Запрашиваемое кол-во": raw["__rq_qty"],
+            "Наличие": _first_truthy(raw, ["availability", "rest", "qty"]),
+            "Расчет по профилю клиента": profile_label,
+            "Поставщик": supplier,
+            "Склад": stock,
+            "Название поставщика": supplier_full,
+            "Срок": deadline,
+            "Цена по профилю": _first_truthy(
+                raw, ["price", "priceOut", "priceInSiteCurrency"]
+            ),
+        }
+    )
+
+
+def build_block_frame(
+    records: List[dict],
+    profile_label: str,
+    distributors_map: Dict[int, str],
+) -> pd.DataFrame:
+    """
+    Строки листа Data для одного блока — всех запросов с одинаковыми
+    запрашиваемыми брендом и артикулом (отличаются только qty): колонки
+    FINAL_COLS, "Группа результата", сортировка внутри блока.
     """
-    _append_log(
-        job,
-        f"Старт проценки ABCP для задачи #{job.id} "
-        f"(profileId={job.client_profile.profile_id})",
+    df = build_data_frame(records, profile_label, distributors_map)
+
+    # "Группа результата": сравниваем нормализованные бренд/артикул
+    # целыми колонками, без построчного apply
+    is_exact = (
+        _norm_series(df["Бренд"]) == _norm_series(df["Запрашиваемый бренд"])
+    ) & (
+        _norm_series(df["Артикул"]) == _norm_series(df["Запрашиваемый артикул"])
+    )
+    df["Группа результата"] = np.where(is_exact, "Запрашиваемый артикул", "Кросс")
+
+    # Очищаем "Запрашиваемое кол-во" для кроссов
+    df["Запрашиваемое кол-во"] = df["Запрашиваемое кол-во"].astype(object)
+    df.loc[~is_exact, "Запрашиваемое кол-во"] = ""
+
+    # Переупорядочиваем колонки (в т.ч. "Название поставщика" после "Склад")
+    df = df.reindex(columns=FINAL_COLS)
+
+    # Сортировка для удобства (запрашиваемые бренд/артикул в блоке одни и те
+    # же, блоки упорядочивает run_abcp_pricing). Сортируем по category-копиям
+    # ключей: сравниваются целые коды категорий, а не Python-строки построчно
+    # (заодно не падаем на смеси чисел и строк в колонке)
+    sort_cols = ["Группа результата", "Бренд", "Артикул"]
+    sort_keys = [f"__k{i}" for i in range(len(sort_cols))]
+    for col, key in zip(sort_cols, sort_keys):
+        df[key] = df[col].astype(str).astype("category")
+    return (
+        df.sort_values(by=sort_keys, kind="mergesort")
+        .drop(columns=sort_keys)
+        .reset_index(drop=True)
     )
 
-    # 1. Проверка .env
-    if not _ensure_env(job):
-        return
 
-    # 2. Читаем входной XLSX
-    try:
-        input_path = Path(job.input_file.path)
-    except Exception as exc:
-        job.status = TenderJob.STATUS_ERROR
-        _append_log(job, f"Ошибка: не удалось получить путь к входному файлу: {exc!r}")
-        return
+# ----------------------- Запись результата -----------------------
 
-    if not input_path.exists():
-        job.status = TenderJob.STATUS_ERROR
-        _append_log(job, f"Ошибка: входной файл не найден: {input_path}")
-        return
+# constant_memory: xlsxwriter сбрасывает строки на диск по мере записи и
+# держит в памяти только текущую. Поэтому писать можно лишь построчно
+# сверху вниз — DataFrame.to_excel пишет по колонкам и в этом режиме теряет
+# ячейки, так что листы пишем сами через write_row.
+XLSX_OPTIONS = {
+    "constant_memory": True,
+    "strings_to_formulas": False,
+    "strings_to_urls": False,
+}
 
-    try:
-        df_in = pd.read_excel(input_path)
-    except Exception as exc:
-        job.status = TenderJob.STATUS_ERROR
-        _append_log(job, f"Ошибка чтения XLSX '{input_path}': {exc!r}")
-        return
 
-    if df_in.empty:
-        job.status = TenderJob.STATUS_ERROR
-        _append_log(job, f"Ошибка: входной файл '{input_path}' пустой.")
-        return
+# Строки Data пишем в TenderResultRow и читаем обратно пачками такого размера
+RESULT_ROWS_BATCH = 1000
 
-    # 3. Определяем колонки
-    try:
-        brand_col, article_col, qty_col = detect_columns(df_in)
-    except Exception as exc:
-        job.status = TenderJob.STATUS_ERROR
-        _append_log(job, f"Ошибка определения колонок бренда/артикула: {exc}")
-        return
 
-    profile_id = job.client_profile.profile_id
-    profile_label = format_profile_name(job.client_profile.name or "")
+def _write_rows(
+    workbook: xlsxwriter.Workbook,
+    name: str,
+    columns: Iterable,
+    rows: Iterable[Sequence],
+) -> None:
+    """Пишет новый лист: шапка, затем строки по порядку."""
+    ws = workbook.add_worksheet(name)
+    header_fmt = workbook.add_format(
+        {"bold": True, "border": 1, "align": "center", "valign": "top"}
+    )
+    ws.write_row(0, 0, [str(c) for c in columns], header_fmt)
 
+    for row_idx, row in enumerate(rows, start=1):
+        ws.write_row(row_idx, 0, row)
 
-    # 3.5. Загружаем список поставщиков один раз для задачи
-    distributors_map: Dict[int, str] = load_distributors_map()
-    if distributors_map:
-        _append_log(job, f"Загружено поставщиков из ABCP: {len(distributors_map)}")
-    else:
-        _append_log(
-            job,
-            "Не удалось получить список поставщиков через cp/distributors "
-            "или список пустой. Колонка 'Название поставщика' может быть пустой.",
-        )
 
-    # 4. Формируем уникальные пары (brand, article, qty)
-    if qty_col:
-        df_pairs = df_in[[brand_col, article_col, qty_col]].dropna(
-            subset=[brand_col, article_col]
+def _save_result_rows(job: TenderJob, block: int, df: pd.DataFrame) -> None:
+    """
+    Сохраняет строки блока листа Data в TenderResultRow пачками по
+    RESULT_ROWS_BATCH. Значения переводим в JSON через DataFrame.to_json:
+    numpy-типы и NaN (-> null) он обрабатывает сам.
+    """
+    for start in range(0, len(df), RESULT_ROWS_BATCH):
+        chunk = df.iloc[start:start + RESULT_ROWS_BATCH]
+        values = orjson.loads(
+            chunk.to_json(orient="values", force_ascii=False, double_precision=15)
         )
-    else:
-        df_pairs = df_in[[brand_col, article_col]].dropna(
-            subset=[brand_col, article_col]
+        TenderResultRow.objects.bulk_create(
+            [
+                TenderResultRow(job=job, block=block, position=start + i, values=row)
+                for i, row in enumerate(values)
+            ],
+            batch_size=RESULT_ROWS_BATCH,
         )
-        df_pairs["__qty"] = None
-        qty_col = "__qty"
 
-    df_pairs = df_pairs.drop_duplicates()
-    pairs = df_pairs.to_dict("records")
-    total_pairs = len(pairs)
 
-    _append_log(
-        job,
-        f"Найдено уникальных запросов (бренд+артикул+qty): {total_pairs}",
-    )
+# ----------------------------- Основная логика -----------------------------
 
-    all_rows: List[Dict[str, str]] = []
-    errors_rows: List[Dict[str, str]] = []
 
-    # 5. Обход пар и запросы к ABCP
-    for i, rec in enumerate(pairs, start=1):
-        brand = str(rec[brand_col]).strip()
-        article = str(rec[article_col]).strip()
-        rq_qty = rec.get(qty_col)
+def run_abcp_pricing(job: TenderJob) -> str:
+    """
+    Основная функция Этапа 1.
 
-        logger.info("=== ABCP поиск %s/%s: %s %s ===", i, total_pairs, brand, article)
+    Что делает:
+      1. Атомарно берёт задачу ("Новая" -> "в обработке"; если её уже
+         взял другой запуск — выходит) и проверяет .env
+         (ABCP_HOST, ABCP_USERLOGIN, ABCP_USERPSW).
+      2. Читает входной XLSX из job.input_file.
+      3. Определяет колонки бренд / артикул / qty.
+      4. Загружает список поставщиков (cp/distributors).
+      5. Формирует уникальные пары (brand, article, qty) и по каждой
+         вызывает ABCP /search/articles/.
+      6. Собирает результаты:
+         - Data (предложения) — DataFrame
+         - Errors (по каким запросам ничего не найдено / ошибка API) — список строк.
+      7. Строки Data по мере прихода ответов пишет в TenderResultRow
+         и из них потоково пишет Excel:
+         MEDIA_ROOT / "tenders/output/abcp_tender_search_job_<id>.xlsx"
+         (листы Data и Errors).
+      8. Обновляет job.result_file, job.status и лог задачи (JobLogEntry).
 
-        items = call_search_articles(
-            ABCP_HOST,
-            ABCP_USERLOGIN,
-            ABCP_USERPSW,
-            brand,
-            article,
-            profile_id,
+    Возвращает итоговый статус; job меняется на месте, так что
+    перечитывать его из БД (refresh_from_db) не нужно.
+    """
+    # Берём задачу атомарно: UPDATE ... WHERE status = 'new'. Повторная
+    # доставка того же сообщения (acks_late) или второй запуск задачи сюда
+    # не проходят и ничего не трогают: ни лог, ни файл, ни TenderResultRow
+    started_at = timezone.now()
+    claimed = TenderJob.objects.filter(
+        pk=job.pk,
+        status=TenderJob.STATUS_NEW,
+    ).update(status=TenderJob.STATUS_PROCESSING, started_at=started_at)
+    if not claimed:
+        job.refresh_from_db(fields=["status"])
+        logger.warning(
+            "Задача #%s уже взята в работу или завершена (статус %s), пропускаем",
+            job.pk,
+            job.status,
         )
+        return job.status
 
-        if not items:
-            logger.warning(
-                "Для %s %s не получено ни одного предложения "
-                "(возможен 404 или пустой ответ API).",
-                brand,
-                article,
-            )
-            errors_rows.append(
-                {
-                    "Запрашиваемый бренд": brand,
-                    "Запрашиваемый артикул": article,
-                    "Запрашиваемое кол-во": rq_qty
-                    if rq_qty is not None
-                    else "",
-                    "Комментарий": "Нет предложений или ошибка API",
-                }
-            )
-            continue
+    job.status, job.started_at = TenderJob.STATUS_PROCESSING, started_at
+    # update() не шлёт post_save — таблицу последних задач сбрасываем сами
+    reset_last_jobs_cache()
 
-        for item in items:
-            row = extract_row_from_item(
-                item,
-                profile_label,
-                brand,
-                article,
-                rq_qty,
-                distributors_map,
-            )
-            all_rows.append(row)
-
-        # Каждые 20 запросов пишем прогресс в лог задачи
-        if i % 20 == 0 or i == total_pairs:
-            _append_log(job, f"Обработано {i} из {total_pairs} запросов...")
-
-    # 6. Формируем DataFrame для листа Data
-    data_columns = [
-        "Запрашиваемый бренд",
-        "Запрашиваемый артикул",
-        "Группа результата",
-        "Бренд",
-        "Артикул",
-        "Описание",
-        "Запрашиваемое кол-во",
-        "Наличие",
-        "Расчет по профилю клиента",
-        "Поставщик",
-        "Склад",
-        "Название поставщика",
-        "Срок",
-        "Расчет по профилю клиента",
-    ]
-
-    if all_rows:
-        df_data = pd.DataFrame(all_rows)
-
-        # Добавляем колонку "Группа результата"
-        df_data["_is_exact"] = df_data.apply(
-            lambda r: (
-                normalize_article(r["Бренд"])
-                == normalize_article(r["Запрашиваемый бренд"])
-                and normalize_article(r["Артикул"])
-                == normalize_article(r["Запрашиваемый артикул"])
-            ),
-            axis=1,
-        )
-        df_data["Группа результата"] = df_data["_is_exact"].map(
-            {True: "Запрашиваемый артикул", False: "Кросс"}
+    with _JobLogger(job) as jl:
+        jl.info(
+            f"Старт проценки ABCP для задачи #{job.id} "
+            f"(profileId={job.client_profile.profile_id})",
         )
-        df_data.drop(columns=["_is_exact"], inplace=True)
 
-        # Очищаем "Запрашиваемое кол-во" для кроссов
-        df_data.loc[
-            df_data["Группа результата"] != "Запрашиваемый артикул",
-            "Запрашиваемое кол-во",
-        ] = ""
+        # 1. Проверка .env
+        if not _ensure_env(jl):
+            return job.status
+
+        # 2. Читаем входной XLSX
+        try:
+            input_path = Path(job.input_file.path)
+        except Exception as exc:
+            jl.info(f"Ошибка: не удалось получить путь к входному файлу: {exc!r}")
+            _set_status(jl, TenderJob.STATUS_ERROR)
+            return job.status
+
+        if not input_path.exists():
+            jl.info(f"Ошибка: входной файл не найден: {input_path}")
+            _set_status(jl, TenderJob.STATUS_ERROR)
+            return job.status
+
+        try:
+            df_in = _read_input_xlsx(input_path)
+        except Exception as exc:
+            jl.info(f"Ошибка чтения XLSX '{input_path}': {exc!r}")
+            _set_status(jl, TenderJob.STATUS_ERROR)
+            return job.status
+
+        if df_in.empty:
+            jl.info(f"Ошибка: входной файл '{input_path}' пустой.")
+            _set_status(jl, TenderJob.STATUS_ERROR)
+            return job.status
+
+        # 3. Определяем колонки
+        try:
+            brand_col, article_col, qty_col = detect_columns(df_in)
+        except Exception as exc:
+            jl.info(f"Ошибка определения колонок бренда/артикула: {exc}")
+            _set_status(jl, TenderJob.STATUS_ERROR)
+            return job.status
+
+        profile_id = job.client_profile.profile_id
+        cfg = _abcp_config()
+        profile_label = format_profile_name(job.client_profile.name or "")
+
+
+        # 3.5. Загружаем список поставщиков один раз для задачи
+        distributors_map: Dict[int, str] = load_distributors_map()
+        if distributors_map:
+            jl.info(f"Загружено поставщиков из ABCP: {len(distributors_map)}")
+        else:
+            jl.info(
+                "Не удалось получить список поставщиков через cp/distributors "
+                "или список пустой. Колонка 'Название поставщика' может быть пустой.",
+            )
+        jl.flush()
+
+        # 4. Формируем уникальные пары (brand, article, qty)
+        mask = df_in[brand_col].notna() & df_in[article_col].notna()
+        cols = [brand_col, article_col] + ([qty_col] if qty_col else [])
+
+        # Чистим бренд/артикул строковыми операциями pandas по всей колонке
+        # сразу и только потом убираем дубли: " Ford " и "Ford" — один запрос
+        df_pairs = df_in.loc[mask, cols].assign(
+            **{col: df_in.loc[mask, col].str.strip() for col in (brand_col, article_col)}
+        ).drop_duplicates()
+
+        if qty_col:
+            # qty прочитан строкой; в результат возвращаем числом, если это число
+            qty_num = pd.to_numeric(df_pairs[qty_col], errors="coerce")
+            df_pairs[qty_col] = qty_num.where(qty_num.notna(), df_pairs[qty_col])
+            pairs = list(df_pairs.itertuples(index=False, name=None))
+        else:
+            pairs = [
+                (brand, article, None)
+                for brand, article in df_pairs.itertuples(index=False, name=None)
+            ]
 
-        # Переупорядочиваем колонки (в т.ч. "Название поставщика" после "Склад")
-        df_data = df_data[
-            [
-                "Запрашиваемый бренд",
-                "Запрашиваемый артикул",
-                "Группа результата",
-                "Бренд",
-                "Артикул",
-                "Описание",
-                "Запрашиваемое кол-во",
-                "Наличие",
-                "Цена по профилю",
-                "Срок",
-                "Склад",
-                "Поставщик",
-                "Название поставщика",
-                "Расчет по профилю клиента",
+        total_pairs = len(pairs)
 
-            ]
-        ]
+        jl.info(
+            f"Найдено уникальных запросов (бренд+артикул+qty): {total_pairs}",
+        )
 
-        # Сортировка для удобства
-        df_data = df_data.sort_values(
-            by=[
-                "Запрашиваемый бренд",
-                "Запрашиваемый артикул",
-                "Группа результата",
-                "Бренд",
-                "Артикул",
-            ],
-            ascending=[True, True, True, True, True],
-        ).reset_index(drop=True)
-    else:
-        df_data = pd.DataFrame(columns=data_columns)
-
-    # 7. Формируем DataFrame для листа Errors
-    err_columns = [
-        "Запрашиваемый бренд",
-        "Запрашиваемый артикул",
-        "Запрашиваемое кол-во",
-        "Комментарий",
-    ]
-
-    if errors_rows:
-        df_errors = pd.DataFrame(errors_rows)[err_columns]
-    else:
-        df_errors = pd.DataFrame(columns=err_columns)
+        # Лист Data собирается блоками: блок — все строки с одинаковыми
+        # запрашиваемыми брендом и артикулом (отличаются только qty).
+        # Блоки идут по алфавиту, поэтому их порядок известен заранее,
+        # и каждый блок пишется в TenderResultRow, как только пришёл ответ
+        # ABCP для него: весь лист Data в памяти не собирается.
+        blocks: Dict[Tuple[str, str], List[int]] = {}
+        for idx, (brand, article, _) in enumerate(pairs):
+            blocks.setdefault((brand, article), []).append(idx)
+        block_rank = {
+            block: rank
+            for rank, block in enumerate(
+                sorted(blocks, key=lambda b: (str(b[0]), str(b[1])))
+            )
+        }
+
+        # Строки Errors по номеру пары: в листе они идут в порядке входного файла
+        errors_by_pair: Dict[int, Dict[str, str]] = {}
+
+        def add_error(idx: int, comment: str) -> None:
+            brand, article, rq_qty = pairs[idx]
+            errors_by_pair[idx] = {
+                "Запрашиваемый бренд": brand,
+                "Запрашиваемый артикул": article,
+                "Запрашиваемое кол-во": "" if pd.isna(rq_qty) else rq_qty,
+                "Комментарий": comment,
+            }
+
+        # 5. Запросы к ABCP. qty в запросе не участвует, поэтому API зовём
+        # один раз на нормализованную пару (бренд, артикул): "AB-12" и "ab12",
+        # а также одна позиция с разным qty — один запрос. Ответ сразу
+        # раскладываем по всем блокам с этим ключом.
+        # Пары, где бренд или артикул после нормализации пустые (одни пробелы,
+        # тире, точки), в API не отправляем — они сразу уходят в Errors.
+        unique_keys: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        key_blocks: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+        for block in blocks:
+            key = (normalize_article(block[0]), normalize_article(block[1]))
+            if all(key):
+                unique_keys.setdefault(key, block)
+                key_blocks.setdefault(key, []).append(block)
+            else:
+                for idx in blocks[block]:
+                    add_error(idx, "Пустой бренд/артикул после нормализации")
+        total_calls = len(unique_keys)
+
+        jl.info(f"Уникальных запросов к ABCP (бренд+артикул): {total_calls}")
+
+        # при повторном запуске задачи старый результат заменяем целиком
+        job.result_rows.all().delete()
+        data_count = 0
+
+        def save_blocks(key: Tuple[str, str], items: List[dict]) -> None:
+            nonlocal data_count
+            for block in key_blocks[key]:
+                if not items:
+                    logger.warning(
+                        "Для %s %s не получено ни одного предложения "
+                        "(возможен 404 или пустой ответ API).",
+                        block[0],
+                        block[1],
+                    )
+                    for idx in blocks[block]:
+                        add_error(idx, "Нет предложений или ошибка API")
+                    continue
+
+                # поля запроса дописываем в каждую позицию ответа,
+                # сами колонки Data считаем потом разом по всему блоку
+                records = []
+                for idx in blocks[block]:
+                    brand, article, rq_qty = pairs[idx]
+                    rq = {
+                        "__rq_brand": brand,
+                        "__rq_article": article,
+                        "__rq_qty": rq_qty if rq_qty is not None else "",
+                    }
+                    records.extend({**item, **rq} for item in items)
+
+                df_block = build_block_frame(records, profile_label, distributors_map)
+                _save_result_rows(job, block_rank[block], df_block)
+                data_count += len(df_block)
+
+        # Это ожидание сети, поэтому запросы шлём параллельно из пула потоков.
+        # Лог задачи и запись строк в БД — только из основного потока.
+        workers = max(1, int(os.getenv("ABCP_CONCURRENCY", "16")))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    call_search_articles,
+                    cfg.host,
+                    cfg.login,
+                    cfg.psw,
+                    brand,
+                    article,
+                    profile_id,
+                ): key
+                for key, (brand, article) in unique_keys.items()
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                save_blocks(futures.pop(future), future.result())
+
+                # Каждые 20 запросов пишем прогресс в лог задачи
+                if done % 20 == 0 or done == total_calls:
+                    jl.info(f"Обработано {done} из {total_calls} запросов...")
+
+                # и каждые 100 — дописываем его в БД одной пачкой
+                if done % 100 == 0:
+                    jl.flush()
+
+        if total_pairs:
+            jl.info(
+                f"Запросов к API: {total_calls} на {total_pairs} строк "
+                f"(повторов без запроса: {total_pairs - total_calls}, "
+                f"{(total_pairs - total_calls) / total_pairs:.0%})",
+            )
 
-    # 8. Сохранение в Excel в MEDIA_ROOT/tenders/output/
-    media_root = Path(settings.MEDIA_ROOT)
-    output_dir = media_root / "tenders" / "output"
-    output_dir.mkdir(parents=True, exist_ok=True)
+        errors_rows = [errors_by_pair[idx] for idx in sorted(errors_by_pair)]
 
-    output_path = output_dir / f"abcp_tender_search_job_{job.id}.xlsx"
+        # 8. Сохранение в Excel в MEDIA_ROOT/tenders/output/
+        output_path = _build_result_path(job)
 
-    try:
-        with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-            df_data.to_excel(writer, sheet_name="Data", index=False)
-            df_errors.to_excel(writer, sheet_name="Errors", index=False)
-
-        # относительный путь от MEDIA_ROOT -> FileField хранит именно его
-        rel_path = output_path.relative_to(media_root)
-        job.result_file.name = str(rel_path).replace("\\", "/")
-        job.status = TenderJob.STATUS_DONE
-
-        _append_log(
-            job,
-            f"OK: файл результата сохранён в {output_path} "
-            f"(строк Data: {len(df_data)}, Errors: {len(df_errors)})",
-        )
-    except Exception as exc:
-        job.status = TenderJob.STATUS_ERROR
-        _append_log(job, f"Ошибка сохранения файла результата: {exc!r}")
+        try:
+            data_rows = (
+                job.result_rows
+                .order_by("block", "position")
+                .values_list("values", flat=True)
+                .iterator(chunk_size=RESULT_ROWS_BATCH)
+            )
+            with xlsxwriter.Workbook(str(output_path), XLSX_OPTIONS) as workbook:
+                _write_rows(workbook, "Data", FINAL_COLS, data_rows)
+                # Errors — несколько колонок и обычно немного строк,
+                # пишем прямо из списка, без DataFrame
+                _write_rows(
+                    workbook,
+                    "Errors",
+                    ERROR_COLS,
+                    ([row.get(col, "") for col in ERROR_COLS] for row in errors_rows),
+                )
+
+            # относительный путь от MEDIA_ROOT -> FileField хранит именно его
+            rel_path = output_path.relative_to(_MEDIA_ROOT)
+            job.result_file.name = str(rel_path).replace("\\", "/")
+            _set_status(jl, TenderJob.STATUS_DONE, "result_file")
+
+            jl.info(
+                f"OK: файл результата сохранён в {output_path} "
+                f"(строк Data: {data_count}, Errors: {len(errors_rows)})",
+            )
+        except Exception as exc:
+            jl.info(f"Ошибка сохранения файла результата: {exc!r}")
+            _set_status(jl, TenderJob.STATUS_ERROR)
+        finally:
+            # строки нужны только для сборки XLSX — дальше результат в файле
+            job.result_rows.all().delete()
+
+    return job.status
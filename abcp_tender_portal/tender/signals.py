@@ -0,0 +1,28 @@
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache_keys import (
+    LAST_JOBS_CACHE_KEY,
+    LAST_JOBS_FRAGMENT,
+    PROFILE_CHOICES_CACHE_KEY,
+)
+from .models import ClientProfile, TenderJob
+
+
+@receiver([post_save, post_delete], sender=ClientProfile)
+def reset_profile_choices(sender, **kwargs):
+    """Список профилей в TenderStep1Form нужно перечитать из БД."""
+    cache.delete(PROFILE_CHOICES_CACHE_KEY)
+
+
+def reset_last_jobs_cache() -> None:
+    """Сброс списка и HTML таблицы последних задач (в т.ч. после QuerySet.update)."""
+    cache.delete_many([LAST_JOBS_CACHE_KEY, make_template_fragment_key(LAST_JOBS_FRAGMENT)])
+
+
+@receiver([post_save, post_delete], sender=TenderJob)
+def reset_last_jobs(sender, **kwargs):
+    """Новая задача или смена статуса — таблицу последних задач перечитать."""
+    reset_last_jobs_cache()
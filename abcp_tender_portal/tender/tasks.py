@@ -0,0 +1,175 @@
+import logging
+from datetime import timedelta
+from smtplib import SMTPException
+
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import LoginCode, TenderJob, TenderResultRow
+from .services.abcp_step1 import mark_job_failed, run_abcp_pricing
+
+logger = logging.getLogger(__name__)
+
+# Зависшие задачи (см. fail_stale_jobs): "Новая" дольше STALE_JOB_AFTER
+# с создания — сообщение потеряно в очереди; "в обработке" дольше предела
+# проценки ABCP_JOB_TIME_LIMIT с начала работы (+ запас) — воркер убит
+STALE_JOB_AFTER = timedelta(hours=6)
+STALE_JOB_GRACE = timedelta(minutes=15)
+
+# Письмо с кодом 2FA (send_2fa_code)
+EMAIL_SUBJECT = "Код входа в ABCP Tender Portal"
+EMAIL_BODY_TMPL = (
+    "Здравствуйте!\n\n"
+    "Ваш одноразовый код для входа: {code}\n\n"
+    "Срок действия кода — 15 минут.\n\n"
+    "Если вы не запрашивали вход, просто проигнорируйте это письмо."
+)
+
+
+@shared_task(time_limit=settings.ABCP_JOB_TIME_LIMIT)
+def run_abcp_pricing_task(job_id: int) -> str | None:
+    """
+    Проценка ABCP для задачи job_id в воркере Celery.
+    Ставится из tender_step1 через transaction.on_commit, поэтому строка
+    TenderJob к этому моменту уже точно сохранена в БД.
+    Возвращает итоговый статус задачи (виден в результате Celery).
+    """
+    try:
+        job = TenderJob.objects.select_related("client_profile").get(pk=job_id)
+    except TenderJob.DoesNotExist:
+        logger.warning("Задача проценки #%s не найдена, пропускаем", job_id)
+        return None
+
+    try:
+        status = run_abcp_pricing(job)
+    except Exception as exc:
+        # ожидаемые ошибки run_abcp_pricing обрабатывает сам; сюда попадает
+        # только неожиданное — не оставляем задачу "в обработке" навсегда
+        logger.exception("Проценка задачи #%s упала", job_id)
+        mark_job_failed(job, f"Ошибка: проценка прервана исключением: {exc!r}")
+        raise
+
+    logger.info("Задача проценки #%s завершена со статусом %s", job_id, status)
+    return status
+
+
+@shared_task(
+    # сбой SMTP-сервера или обрыв соединения — пробуем ещё, с паузой 1, 2, 4 с
+    autoretry_for=(SMTPException, ConnectionError),
+    retry_backoff=True,
+    max_retries=3,
+)
+def send_2fa_code(email: str, code: str) -> None:
+    """
+    Отправка письма с кодом 2FA. Ставится из login_step1, чтобы SMTP
+    (соединение, TLS, ответ сервера) не держал веб-воркер.
+    """
+    send_mail(
+        EMAIL_SUBJECT,
+        EMAIL_BODY_TMPL.format(code=code),
+        settings.DEFAULT_FROM_EMAIL,
+        [email],
+        fail_silently=False,
+    )
+
+
+@shared_task
+def record_login_code(user_id: int, code: str) -> None:
+    """Журнал выданных кодов 2FA: запись в LoginCode вне запроса login_step1."""
+    # mark_login_code_used мог выполниться раньше и уже записать код
+    # использованным (см. там) — второй, "неиспользованной" записи не нужно
+    if LoginCode.objects.filter(
+        user_id=user_id,
+        code=code,
+        is_used=True,
+        created_at__gte=timezone.now() - LoginCode.TTL,
+    ).exists():
+        return
+    LoginCode.objects.create(user_id=user_id, code=code)
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=2)
+def mark_login_code_used(self, user_id: int, code: str) -> None:
+    """
+    Отмечает в журнале LoginCode, что код использован для входа.
+
+    record_login_code и эта задача могут выполниться не по порядку (быстрый
+    пользователь, повтор, разные воркеры): если записи кода ещё нет, пробуем
+    позже, а после последней попытки пишем код сразу использованным.
+    """
+    if LoginCode.consume(user_id, code):
+        return
+
+    if self.request.retries < self.max_retries:
+        raise self.retry()
+
+    logger.warning(
+        "Код 2FA пользователя #%s не найден в журнале, записываем как использованный",
+        user_id,
+    )
+    LoginCode.objects.create(user_id=user_id, code=code, is_used=True)
+
+
+@shared_task
+def purge_login_codes() -> int:
+    """
+    Удаляет коды 2FA старше суток (запускается по расписанию Celery beat),
+    чтобы таблица и индекс logincode_lookup_idx не росли бесконечно.
+    """
+    deleted, _ = LoginCode.objects.filter(
+        created_at__lt=timezone.now() - timedelta(hours=24),
+    ).delete()
+    logger.info("Удалено устаревших кодов 2FA: %s", deleted)
+    return deleted
+
+
+@shared_task
+def purge_result_rows() -> int:
+    """
+    Удаляет строки TenderResultRow завершённых задач (запускается по
+    расписанию Celery beat). Обычно run_abcp_pricing удаляет их сам после
+    записи XLSX; здесь подчищаем остатки задач, воркер которых был убит.
+    """
+    deleted, _ = TenderResultRow.objects.exclude(
+        job__status__in=[TenderJob.STATUS_NEW, TenderJob.STATUS_PROCESSING],
+    ).delete()
+    if deleted:
+        logger.info("Удалено строк результата завершённых задач: %s", deleted)
+    return deleted
+
+
+@shared_task
+def fail_stale_jobs() -> int:
+    """
+    Переводит в "Ошибка" задачи, которые слишком долго висят в очереди или
+    в обработке (запускается по расписанию Celery beat). Иначе такая задача
+    навсегда остаётся активной, и страница tender_step1 обновляется без конца.
+    """
+    now = timezone.now()
+    running_since = now - timedelta(seconds=settings.ABCP_JOB_TIME_LIMIT) - STALE_JOB_GRACE
+    stale = TenderJob.objects.filter(
+        Q(status=TenderJob.STATUS_NEW, created_at__lt=now - STALE_JOB_AFTER)
+        | Q(status=TenderJob.STATUS_PROCESSING, started_at__lt=running_since)
+        # задачи, взятые в работу до появления started_at
+        | Q(
+            status=TenderJob.STATUS_PROCESSING,
+            started_at__isnull=True,
+            created_at__lt=now - STALE_JOB_AFTER,
+        )
+    ).only("id", "status")
+
+    count = 0
+    for job in stale.iterator():
+        mark_job_failed(
+            job,
+            "Ошибка: задача не завершилась вовремя "
+            "(потеряна в очереди или воркер остановлен). Запустите проценку заново.",
+        )
+        count += 1
+
+    if count:
+        logger.warning("Помечено зависших задач проценки: %s", count)
+    return count
@@ -1,3 +1,368 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+
+from . import views
+from .models import ClientProfile, JobLogEntry, LoginCode, TenderJob
+
+User = get_user_model()
+
+# Тесты не зависят от окружения: кэш в памяти процесса, static без манифеста
+# collectstatic, файлы задач — во временном каталоге
+TEST_SETTINGS = {
+    "CACHES": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    "STORAGES": {
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    },
+}
+
+
+@override_settings(**TEST_SETTINGS)
+class TenderTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._media = tempfile.mkdtemp()
+        cls._media_override = override_settings(MEDIA_ROOT=cls._media)
+        cls._media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._media_override.disable()
+        shutil.rmtree(cls._media, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("manager", "manager@example.com")
+        self.profile = ClientProfile.objects.create(name="CPZ / Клиент", profile_id="42")
+
+    def make_job(self, status=TenderJob.STATUS_NEW, **kwargs) -> TenderJob:
+        return TenderJob.objects.create(
+            created_by=self.user,
+            client_profile=self.profile,
+            status=status,
+            input_file="tenders/input/in.xlsx",
+            **kwargs,
+        )
+
+
+class JobListQueriesTests(TenderTestCase):
+    """Число запросов списков задач не растёт с числом задач (нет N+1)."""
+
+    def setUp(self):
+        super().setUp()
+        for i in range(10):
+            if i % 2:
+                job = self.make_job(status=TenderJob.STATUS_ERROR)
+            else:
+                job = self.make_job(
+                    status=TenderJob.STATUS_DONE, result_file="tenders/output/r.xlsx"
+                )
+            JobLogEntry.objects.bulk_create(
+                JobLogEntry(job=job, seq=seq, message=f"строка {seq}")
+                for seq in range(1, 6)
+            )
+        self.client.force_login(self.user)
+
+    def test_dashboard_latest_jobs_single_query(self):
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+
+        # профиль и автор приходят одним JOIN
+        with self.assertNumQueries(1):
+            rows = [
+                (job.client_profile.name, job.created_by.username)
+                for job in response.context["latest_jobs"]
+            ]
+        self.assertEqual(len(rows), 10)
+
+    def test_tender_step1_get_queries(self):
+        # сессия, пользователь, профили для формы, задачи с профилем,
+        # последняя строка лога у задач с ошибкой
+        with self.assertNumQueries(5):
+            response = self.client.get("/tender/step1/")
+        self.assertContains(response, "строка 5", count=5)
+        self.assertNotContains(response, "строка 4")
+
+        # повторный GET: профили, список задач и HTML таблицы — из кэша
+        with self.assertNumQueries(2):
+            self.client.get("/tender/step1/")
+
+    def test_last_jobs_loads_only_displayed_columns(self):
+        from .views import _last_jobs
+
+        jobs = _last_jobs()
+        self.assertEqual(len(jobs), 10)
+        self.assertIn("log", jobs[0].get_deferred_fields())
+        with self.assertNumQueries(0):
+            for job in jobs:
+                job.client_profile.profile_id, job.last_log_line
+
+
+class MigrationsTests(TestCase):
+    def test_models_match_migrations(self):
+        # makemigrations --check завершается SystemExit, если модели разошлись с миграциями
+        out = StringIO()
+        try:
+            call_command("makemigrations", "tender", check=True, dry_run=True, stdout=out)
+        except SystemExit:
+            self.fail(f"Модели не совпадают с миграциями:\n{out.getvalue()}")
+
+
+class UrlsTests(TestCase):
+    def test_names_resolve_to_views(self):
+        cases = [
+            ("tender:dashboard", (), "/", views.dashboard),
+            ("tender:login_step1", (), "/login/", views.login_step1),
+            ("tender:login_step2", (), "/login/confirm/", views.login_step2),
+            ("tender:tender_step1", (), "/tender/step1/", views.tender_step1),
+            ("tender:download_input", (7,), "/tender/jobs/7/input/", views.download_input),
+            ("tender:download_result", (7,), "/tender/jobs/7/result/", views.download_result),
+        ]
+        for name, args, path, view in cases:
+            with self.subTest(name=name):
+                self.assertEqual(reverse(name, args=args), path)
+                self.assertIs(resolve(path).func, view)
+
+
+@mock.patch("tender.views.mark_login_code_used")
+@mock.patch("tender.views.record_login_code")
+@mock.patch("tender.views.send_2fa_code")
+class LoginTests(TenderTestCase):
+    """Двухшаговый вход: задачи Celery подменены, код берём из send_2fa_code.delay."""
+
+    def request_code(self, send_2fa_code, email="Manager@Example.com", **extra):
+        response = self.client.post(reverse("tender:login_step1"), {"email": email}, **extra)
+        if response.status_code != 302:
+            return response, None
+        return response, send_2fa_code.delay.call_args.args[1]
+
+    def test_login_with_emailed_code(self, send_2fa_code, record_login_code, mark_used):
+        response, code = self.request_code(send_2fa_code)
+        self.assertRedirects(response, reverse("tender:login_step2"))
+        send_2fa_code.delay.assert_called_once_with("manager@example.com", code)
+        record_login_code.delay.assert_called_once_with(self.user.id, code)
+        self.assertEqual(cache.get(LoginCode.cache_key(self.user.id)), code)
+
+        response = self.client.post(reverse("tender:login_step2"), {"code": code})
+        self.assertRedirects(response, reverse("tender:dashboard"))
+        self.assertEqual(int(self.client.session["_auth_user_id"]), self.user.id)
+        self.assertNotIn("2fa_user_id", self.client.session)
+        mark_used.delay.assert_called_once_with(self.user.id, code)
+
+    def test_code_is_single_use(self, send_2fa_code, record_login_code, mark_used):
+        _, code = self.request_code(send_2fa_code)
+        self.client.post(reverse("tender:login_step2"), {"code": code})
+
+        # повтор того же кода (например, параллельный запрос) не проходит
+        session = self.client.session
+        session["2fa_user_id"] = self.user.id
+        session.save()
+        response = self.client.post(reverse("tender:login_step2"), {"code": code})
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(response.context["form"], "code", "Неверный или просроченный код.")
+        self.assertIsNone(cache.get(LoginCode.cache_key(self.user.id)))
+        mark_used.delay.assert_called_once()
+
+    def test_wrong_code_rejected(self, send_2fa_code, record_login_code, mark_used):
+        _, code = self.request_code(send_2fa_code)
+        wrong = f"{(int(code) + 1) % 1_000_000:06d}"
+
+        response = self.client.post(reverse("tender:login_step2"), {"code": wrong})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("_auth_user_id", self.client.session)
+        # неверная попытка не сжигает действующий код
+        self.assertEqual(cache.get(LoginCode.cache_key(self.user.id)), code)
+        mark_used.delay.assert_not_called()
+
+    def test_unknown_email(self, send_2fa_code, record_login_code, mark_used):
+        response, _ = self.request_code(send_2fa_code, email="nobody@example.com")
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response.context["form"], "email", "Пользователь с таким e-mail не найден."
+        )
+        send_2fa_code.delay.assert_not_called()
+
+    def test_broker_failure_keeps_user_on_step1(self, send_2fa_code, record_login_code, mark_used):
+        send_2fa_code.delay.side_effect = OSError("broker down")
+        response, _ = self.request_code(send_2fa_code)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("2fa_user_id", self.client.session)
+
+    def test_step2_without_step1_redirects(self, send_2fa_code, record_login_code, mark_used):
+        response = self.client.get(reverse("tender:login_step2"))
+        self.assertRedirects(response, reverse("tender:login_step1"))
+
+    @override_settings(LOGIN_RATE_PER_IP=5, LOGIN_RATE_PER_EMAIL=100)
+    def test_rate_limit_per_ip(self, send_2fa_code, record_login_code, mark_used):
+        # TRUSTED_PROXY_COUNT=0: подставной X-Forwarded-For лимит не обходит
+        for i in range(5):
+            response, _ = self.request_code(send_2fa_code, HTTP_X_FORWARDED_FOR=f"10.0.0.{i}")
+            self.assertEqual(response.status_code, 302)
+        response, _ = self.request_code(send_2fa_code, HTTP_X_FORWARDED_FOR="10.0.0.99")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(send_2fa_code.delay.call_count, 5)
+
+    @override_settings(LOGIN_RATE_PER_IP=100, LOGIN_RATE_PER_EMAIL=3, TRUSTED_PROXY_COUNT=1)
+    def test_rate_limit_per_email(self, send_2fa_code, record_login_code, mark_used):
+        for i in range(3):
+            response, _ = self.request_code(send_2fa_code, HTTP_X_FORWARDED_FOR=f"10.0.0.{i}")
+            self.assertEqual(response.status_code, 302)
+        response, _ = self.request_code(send_2fa_code, HTTP_X_FORWARDED_FOR="10.0.0.99")
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(LOGIN_RATE_PER_IP=2, TRUSTED_PROXY_COUNT=1)
+    def test_rate_limit_by_forwarded_ip_behind_proxy(self, send_2fa_code, record_login_code, mark_used):
+        # за прокси клиенты с разными адресами не делят один лимит
+        for ip in ("10.0.0.1", "10.0.0.1", "10.0.0.2"):
+            response, _ = self.request_code(
+                send_2fa_code, email="nobody@example.com", HTTP_X_FORWARDED_FOR=ip
+            )
+            self.assertEqual(response.status_code, 200)
+        response, _ = self.request_code(
+            send_2fa_code, email="nobody@example.com", HTTP_X_FORWARDED_FOR="10.0.0.1"
+        )
+        self.assertEqual(response.status_code, 429)
+
+
+class DashboardTests(TenderTestCase):
+    def test_requires_login(self):
+        response = self.client.get(reverse("tender:dashboard"))
+        self.assertRedirects(response, f"{reverse('tender:login_step1')}?next=/")
+
+    def test_lists_latest_jobs(self):
+        job = self.make_job()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("tender:dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["latest_jobs"]), [job])
+
+
+class TenderStep1Tests(TenderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def post_file(self):
+        upload = SimpleUploadedFile("tender.xlsx", b"xlsx", content_type=views.XLSX_CONTENT_TYPE)
+        return self.client.post(
+            reverse("tender:tender_step1"),
+            {"client_profile": self.profile.pk, "input_file": upload},
+        )
+
+    def test_get_shows_form_and_jobs(self):
+        job = self.make_job()
+        response = self.client.get(reverse("tender:tender_step1"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["last_jobs"], [job])
+        self.assertTrue(response.context["has_active_jobs"])
+        self.assertContains(response, reverse("tender:download_input", args=[job.id]))
+
+    @mock.patch("tender.views.run_abcp_pricing_task")
+    def test_post_enqueues_job_after_commit(self, task):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_file()
+        self.assertRedirects(response, reverse("tender:tender_step1"))
+
+        job = TenderJob.objects.get()
+        self.assertEqual(job.status, TenderJob.STATUS_NEW)
+        self.assertEqual(job.created_by, self.user)
+        self.assertEqual(job.client_profile, self.profile)
+        task.delay.assert_called_once_with(job.pk)
+
+    @mock.patch("tender.views.run_abcp_pricing_task")
+    def test_post_enqueue_failure_marks_job_failed(self, task):
+        task.delay.side_effect = OSError("broker down")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_file()
+
+        job = TenderJob.objects.get()
+        self.assertEqual(job.status, TenderJob.STATUS_ERROR)
+        self.assertIn("не удалось поставить задачу в очередь", job.last_log_line)
+
+    @mock.patch("tender.views.run_abcp_pricing_task")
+    def test_post_rejects_wrong_extension(self, task):
+        upload = SimpleUploadedFile("tender.csv", b"a;b")
+        response = self.client.post(
+            reverse("tender:tender_step1"),
+            {"client_profile": self.profile.pk, "input_file": upload},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(TenderJob.objects.exists())
+        task.delay.assert_not_called()
+
+
+class DownloadTests(TenderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.job = self.make_job(status=TenderJob.STATUS_DONE)
+        self.job.input_file.save("in.xlsx", ContentFile(b"input"), save=False)
+        self.job.result_file.save("result.xlsx", ContentFile(b"result"), save=False)
+        self.job.save()
+        self.client.force_login(self.user)
+
+    def get(self, name, job=None):
+        return self.client.get(reverse(f"tender:{name}", args=[(job or self.job).id]))
+
+    def test_requires_login(self):
+        self.client.logout()
+        for name in ("download_input", "download_result"):
+            with self.subTest(name=name):
+                response = self.get(name)
+                self.assertEqual(response.status_code, 302)
+                self.assertTrue(response["Location"].startswith(reverse("tender:login_step1")))
+
+    @override_settings(RESULT_ACCEL_REDIRECT_PREFIX="", DEBUG=False)
+    def test_file_response_without_accel_prefix(self):
+        for name, body in (("download_input", b"input"), ("download_result", b"result")):
+            with self.subTest(name=name):
+                response = self.get(name)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn("X-Accel-Redirect", response)
+                self.assertEqual(response["Content-Type"], views.XLSX_CONTENT_TYPE)
+                self.assertIn("attachment", response["Content-Disposition"])
+                self.assertEqual(b"".join(response.streaming_content), body)
+                response.close()
+
+    @override_settings(RESULT_ACCEL_REDIRECT_PREFIX="/internal/", DEBUG=False)
+    def test_accel_redirect_with_prefix(self):
+        for name, field in (
+            ("download_input", self.job.input_file),
+            ("download_result", self.job.result_file),
+        ):
+            with self.subTest(name=name):
+                response = self.get(name)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["X-Accel-Redirect"], f"/internal/{field.name}")
+                self.assertIn("attachment", response["Content-Disposition"])
+                self.assertEqual(response.content, b"")
+
+    @override_settings(RESULT_ACCEL_REDIRECT_PREFIX="/internal/", DEBUG=True)
+    def test_debug_serves_file_directly(self):
+        response = self.get("download_result")
+        self.assertNotIn("X-Accel-Redirect", response)
+        self.assertEqual(b"".join(response.streaming_content), b"result")
+        response.close()
+
+    def test_result_not_ready(self):
+        job = self.make_job(status=TenderJob.STATUS_PROCESSING)
+        self.assertEqual(self.get("download_result", job).status_code, 404)
+
+    def test_missing_file_on_disk(self):
+        job = self.make_job(status=TenderJob.STATUS_DONE, result_file="tenders/output/gone.xlsx")
+        self.assertEqual(self.get("download_result", job).status_code, 404)
+
+    def test_unknown_job(self):
+        response = self.client.get(reverse("tender:download_result", args=[999_999]))
+        self.assertEqual(response.status_code, 404)
@@ -8,5 +8,7 @@ urlpatterns = [
     path("login/", views.login_step1, name="login_step1"),       # шаг 1 логина
     path("login/confirm/", views.login_step2, name="login_step2"),
     path("tender/step1/", views.tender_step1, name="tender_step1"),
+    path("tender/jobs/<int:job_id>/input/", views.download_input, name="download_input"),
+    path("tender/jobs/<int:job_id>/result/", views.download_result, name="download_result"),
     path("logout/", views.logout_view, name="logout"),
 ]
@@ -1,80 +1,137 @@
+import hmac
 import logging
-import random
-from datetime import timedelta
+import mimetypes
+import os
+import secrets
+from urllib.parse import quote
 
+from django.conf import settings
 from django.contrib import messages
-from django.contrib.auth import get_user_model, login
+from django.contrib.auth import get_user_model, login, logout
 from django.contrib.auth.decorators import login_required
-from django.http import HttpRequest, HttpResponse
-from django.shortcuts import render, redirect
-from django.utils import timezone
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.db.models.functions import Lower
+from django.http import FileResponse, Http404, HttpRequest, HttpResponse
+from django.shortcuts import get_object_or_404, render, redirect
+from django.utils.http import content_disposition_header
+from django.views.decorators.http import require_http_methods
 
+from .cache_keys import LAST_JOBS_CACHE_KEY, LAST_JOBS_CACHE_TIMEOUT
 from .forms import EmailLoginForm, CodeConfirmForm, TenderStep1Form
-from .models import LoginCode, TenderJob
-from .services.abcp_step1 import run_abcp_pricing
+from .models import JobLogEntry, LoginCode, TenderJob
+from .services.abcp_step1 import mark_job_failed
+from .tasks import (
+    mark_login_code_used,
+    record_login_code,
+    run_abcp_pricing_task,
+    send_2fa_code,
+)
 
-from django.contrib.auth import logout
-from django.views.decorators.http import require_http_methods
 
-from django.core.mail import send_mail
-from django.conf import settings
+logger = logging.getLogger(__name__)
+User = get_user_model()
 
 
+def _client_ip(request: HttpRequest) -> str:
+    """
+    IP клиента с учётом reverse proxy (nginx/Timeweb).
 
-logger = logging.getLogger(__name__)
-User = get_user_model()
+    За прокси REMOTE_ADDR — адрес самого прокси, общий для всех клиентов.
+    Доверяем заголовку CLIENT_IP_HEADER (по умолчанию X-Forwarded-For) только
+    на TRUSTED_PROXY_COUNT звеньев: каждый прокси дописывает адрес справа,
+    поэтому берём N-й адрес с конца — всё левее мог подставить сам клиент.
+    """
+    count = settings.TRUSTED_PROXY_COUNT
+    header = request.headers.get(settings.CLIENT_IP_HEADER, "") if count else ""
+    chain = [part.strip() for part in header.split(",") if part.strip()]
+    if chain:
+        return chain[-min(count, len(chain))]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _rate_limited(key: str, limit: int) -> bool:
+    """
+    Счётчик запросов в кэше: add создаёт ключ с TTL LOGIN_RATE_PERIOD, incr
+    атомарно увеличивает его (в Redis — INCR). True, если лимит за окно превышен.
+    """
+    period = settings.LOGIN_RATE_PERIOD
+    cache.add(key, 0, period)
+    try:
+        return cache.incr(key) > limit
+    except ValueError:
+        # ключ успел истечь между add и incr — окно началось заново
+        cache.add(key, 1, period)
+        return False
+
+
+def _too_many_requests() -> HttpResponse:
+    return HttpResponse(
+        "Слишком много запросов кода. Попробуйте через минуту.",
+        status=429,
+        content_type="text/plain; charset=utf-8",
+    )
 
 
 def login_step1(request: HttpRequest) -> HttpResponse:
     """
-    Шаг 1: ввод e-mail, генерация кода и запись в LoginCode.
-    Теперь код отправляется на e-mail пользователя через SMTP.
+    Шаг 1: ввод e-mail, генерация кода (в кэш и в журнал LoginCode).
+    Письмо с кодом отправляется в фоне задачей Celery send_2fa_code.
     """
     if request.method == "POST":
+        # До валидации формы и запросов в БД
+        ip = _client_ip(request)
+        if _rate_limited(f"rl:login:ip:{ip}", settings.LOGIN_RATE_PER_IP):
+            return _too_many_requests()
+
         form = EmailLoginForm(request.POST)
         if form.is_valid():
             email = form.cleaned_data["email"].strip().lower()
 
-            try:
-                user = User.objects.get(email__iexact=email, is_active=True)
-            except User.DoesNotExist:
+            # отдельный, меньший лимит на адрес — против перебора e-mail
+            if _rate_limited(f"rl:login:email:{email}", settings.LOGIN_RATE_PER_EMAIL):
+                return _too_many_requests()
+
+            # email уже в нижнем регистре: LOWER(email) = %s идёт по
+            # индексу user_email_lower_idx (миграция 0009), iexact — нет.
+            # Модель User здесь не нужна — только id для сессии и имя для лога,
+            # полностью пользователь загружается на шаге 2 для login()
+            user = (
+                User.objects
+                .annotate(email_lower=Lower("email"))
+                .filter(email_lower=email, is_active=True)
+                .values("id", "username")
+                .first()
+            )
+            if user is None:
                 form.add_error("email", "Пользователь с таким e-mail не найден.")
             else:
-                # 6-значный код
-                code = f"{random.randint(0, 999999):06d}"
+                user_id, username = user["id"], user["username"]
 
-                LoginCode.objects.create(
-                    user=user,
-                    code=code,
+                # 6-значный код
+                code = f"{secrets.randbelow(1_000_000):06d}"
+
+                # Действующий код держим в кэше с TTL; запись в журнал
+                # LoginCode делает воркер
+                cache.set(
+                    LoginCode.cache_key(user_id),
+                    code,
+                    int(LoginCode.TTL.total_seconds()),
                 )
 
                 logger.info(
-                    f"2FA-код для пользователя {user.username} ({email}): {code}"
+                    f"2FA-код для пользователя {username} ({email}): {code}"
                 )
 
-                # Пытаемся отправить письмо
-                subject = "Код входа в ABCP Tender Portal"
-                message = (
-                    "Здравствуйте!\n\n"
-                    f"Ваш одноразовый код для входа: {code}\n\n"
-                    "Срок действия кода — 15 минут.\n\n"
-                    "Если вы не запрашивали вход, просто проигнорируйте это письмо."
-                )
-                from_email = settings.DEFAULT_FROM_EMAIL
-                recipient_list = [email]
-
+                # Письмо отправляет воркер Celery; здесь только ставим задачи
                 try:
-                    send_mail(
-                        subject,
-                        message,
-                        from_email,
-                        recipient_list,
-                        fail_silently=False,
-                    )
+                    record_login_code.delay(user_id, code)
+                    send_2fa_code.delay(email, code)
                 except Exception as e:
                     logger.error(
-                        "Ошибка отправки 2FA-кода пользователю %s (%s): %s",
-                        user.username,
+                        "Не удалось поставить отправку 2FA-кода пользователю %s (%s): %s",
+                        username,
                         email,
                         e,
                         exc_info=True,
@@ -85,8 +142,8 @@ def login_step1(request: HttpRequest) -> HttpResponse:
                         "Проверьте корректность e-mail или попробуйте позже.",
                     )
                 else:
-                    # Сохраняем id пользователя в сессии только если письмо ушло
-                    request.session["2fa_user_id"] = user.id
+                    # Сохраняем id пользователя в сессии, только если письмо в очереди
+                    request.session["2fa_user_id"] = user_id
                     messages.success(
                         request,
                         f"Код подтверждения отправлен на {email}. "
@@ -118,27 +175,26 @@ def login_step2(request: HttpRequest) -> HttpResponse:
         if form.is_valid():
             code = form.cleaned_data["code"].strip()
 
-            now = timezone.now()
-            valid_from = now - timedelta(minutes=15)  # код живёт 15 минут
-
-            login_code = (
-                LoginCode.objects
-                .filter(
-                    user=user,
-                    code=code,
-                    is_used=False,
-                    created_at__gte=valid_from,
-                )
-                .order_by("-created_at")
-                .first()
-            )
-
-            if not login_code:
+            key = LoginCode.cache_key(user.id)
+            stored = cache.get(key)
+            # Код одноразовый: дальше проходит только тот запрос, который сам
+            # удалил ключ (delete возвращает True ровно одному из параллельных)
+            if (
+                not stored
+                or not hmac.compare_digest(stored.encode(), code.encode())
+                or not cache.delete(key)
+            ):
                 form.add_error("code", "Неверный или просроченный код.")
             else:
-                login_code.is_used = True
-                login_code.save(update_fields=["is_used"])
-
+                try:
+                    mark_login_code_used.delay(user.id, code)
+                except Exception:
+                    # журнал не должен мешать входу
+                    logger.warning(
+                        "Не удалось отметить код 2FA пользователя %s в журнале",
+                        user.username,
+                        exc_info=True,
+                    )
                 login(request, user)
                 request.session.pop("2fa_user_id", None)
 
@@ -172,11 +228,48 @@ def dashboard(request: HttpRequest) -> HttpResponse:
     return render(request, "tender/dashboard.html", context)
 
 
+def _last_jobs() -> list:
+    """Последние 10 задач (список моделей с профилем) из кэша."""
+    def load() -> list:
+        # В таблице показываем профиль клиента, автора задачи нет — его JOIN не нужен.
+        # Берём только выводимые колонки; FK client_profile нужен для JOIN.
+        # Для подсказки у задач с ошибкой — одна последняя строка лога
+        # (TenderJob.last_log_line), а не весь лог каждой задачи
+        last_error_line = Prefetch(
+            "log_entries",
+            queryset=(
+                JobLogEntry.objects
+                .filter(job__status=TenderJob.STATUS_ERROR)
+                .only("id", "job_id", "message")
+                .order_by("-seq")[:1]
+            ),
+            to_attr="last_log_entries",
+        )
+        return list(
+            TenderJob.objects
+            .select_related("client_profile")
+            .only(
+                "id",
+                "status",
+                "created_at",
+                "input_file",
+                "result_file",
+                "client_profile",
+                "client_profile__name",
+                "client_profile__profile_id",
+            )
+            .prefetch_related(last_error_line)
+            .order_by("-created_at")[:10]
+        )
+
+    return cache.get_or_set(LAST_JOBS_CACHE_KEY, load, LAST_JOBS_CACHE_TIMEOUT)
+
+
 @login_required
 def tender_step1(request: HttpRequest) -> HttpResponse:
     """
     Этап 1: форма загрузки XLSX и запуск проценки по API ABCP.
-    Пока проценка реализована заглушкой в run_abcp_pricing().
+    Сама проценка (run_abcp_pricing) выполняется в воркере Celery.
     """
     if request.method == "POST":
         form = TenderStep1Form(request.POST, request.FILES)
@@ -184,6 +277,8 @@ def tender_step1(request: HttpRequest) -> HttpResponse:
             client_profile = form.cleaned_data["client_profile"]
             upload = form.cleaned_data["input_file"]
 
+            # Задача "Новая" = ждёт в очереди; в "в обработке" её переводит
+            # воркер, когда берёт в работу (run_abcp_pricing)
             job = TenderJob.objects.create(
                 created_by=request.user,
                 client_profile=client_profile,
@@ -192,46 +287,138 @@ def tender_step1(request: HttpRequest) -> HttpResponse:
                 log="",
             )
 
-            # Ставим статус "в обработке"
-            job.status = TenderJob.STATUS_PROCESSING
-            job.save(update_fields=["status"])
-
-            # Синхронно запускаем проценку
-            run_abcp_pricing(job)
+            enqueue_failed = False
 
-            # Перечитываем задачу из базы (мог измениться статус/лог/файл результата)
-            job.refresh_from_db()
+            def enqueue() -> None:
+                nonlocal enqueue_failed
+                try:
+                    run_abcp_pricing_task.delay(job.pk)
+                except Exception as e:
+                    # брокер недоступен — иначе задача навсегда осталась бы "Новая"
+                    logger.error(
+                        "Не удалось поставить проценку задачи #%s в очередь: %s",
+                        job.pk,
+                        e,
+                        exc_info=True,
+                    )
+                    enqueue_failed = True
+                    mark_job_failed(
+                        job,
+                        f"Ошибка: не удалось поставить задачу в очередь проценки: {e!r}",
+                    )
 
-            if job.status == TenderJob.STATUS_DONE:
-                msg = (
-                    f"Задача #{job.id} выполнена. "
-                    f"Результат можно скачать в таблице справа."
+            # Ставим проценку в очередь, когда строка задачи уже в БД.
+            # Вне transaction.atomic on_commit вызывает enqueue сразу,
+            # поэтому ниже уже известно, удалось ли поставить задачу
+            transaction.on_commit(enqueue)
+
+            if not enqueue_failed and settings.CELERY_TASK_ALWAYS_EAGER:
+                # без брокера проценка уже прошла прямо в этом процессе
+                # (над своей копией задачи) — берём итоговый статус из БД
+                job.refresh_from_db(fields=["status"])
+
+            if enqueue_failed:
+                messages.error(
+                    request,
+                    f"Задачу #{job.id} не удалось поставить в очередь на проценку. "
+                    "Попробуйте позже.",
+                )
+            elif job.status == TenderJob.STATUS_DONE:
+                messages.success(
+                    request,
+                    f"Задача #{job.id} обработана. Результат — в таблице справа.",
+                )
+            elif job.status == TenderJob.STATUS_ERROR:
+                messages.error(
+                    request,
+                    f"Проценка задачи #{job.id} завершилась с ошибкой. "
+                    "Причина — в таблице справа.",
                 )
             else:
-                msg = (
-                    f"Задача #{job.id} создана, но возникла ошибка. "
-                    f"Смотрите лог в админке."
+                messages.success(
+                    request,
+                    f"Задача #{job.id} поставлена в очередь на проценку. "
+                    f"Статус и результат — в таблице справа.",
                 )
-
-            messages.success(request, msg)
             return redirect("tender:tender_step1")
     else:
         form = TenderStep1Form()
 
-    # Последние задачи для правого блока
-    last_jobs = (
-        TenderJob.objects
-        .select_related("client_profile", "created_by")
-        .order_by("-created_at")[:10]
+    last_jobs = _last_jobs()
+
+    # Пока есть задачи в очереди/в работе, страница сама обновляет статусы
+    has_active_jobs = any(
+        job.status in (TenderJob.STATUS_NEW, TenderJob.STATUS_PROCESSING)
+        for job in last_jobs
     )
 
     context = {
         "form": form,
         "last_jobs": last_jobs,
+        "has_active_jobs": has_active_jobs,
+        "last_jobs_cache_timeout": LAST_JOBS_CACHE_TIMEOUT,
     }
     return render(request, "tender/tender_step1.html", context)
 
 
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _job_file_response(field, not_found: str) -> HttpResponse:
+    """
+    Отдача файла задачи (FieldFile из MEDIA_ROOT) как вложения.
+
+    Если задан RESULT_ACCEL_REDIRECT_PREFIX (и DEBUG выключен), отдаём пустой
+    ответ с X-Accel-Redirect — байты файла через sendfile шлёт nginx,
+    а воркер Django освобождается сразу после заголовков.
+    Иначе (dev) файл отдаёт сам Django через FileResponse.
+    """
+    filename = os.path.basename(field.name)
+    content_type = mimetypes.guess_type(filename)[0] or XLSX_CONTENT_TYPE
+    prefix = settings.RESULT_ACCEL_REDIRECT_PREFIX
+
+    if prefix and not settings.DEBUG:
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(field.name)
+        response["Content-Disposition"] = content_disposition_header(True, filename)
+        return response
+
+    try:
+        fh = open(field.path, "rb")
+    except FileNotFoundError:
+        raise Http404(not_found)
+
+    return FileResponse(
+        fh,
+        as_attachment=True,
+        filename=filename,
+        content_type=content_type,
+    )
+
+
+@login_required
+def download_result(request: HttpRequest, job_id: int) -> HttpResponse:
+    """Скачивание XLSX с результатом проценки."""
+    job = get_object_or_404(TenderJob.objects.only("id", "result_file"), pk=job_id)
+    if not job.result_file:
+        raise Http404("Результат для этой задачи ещё не готов.")
+
+    return _job_file_response(job.result_file, "Файл результата не найден.")
+
+
+@login_required
+def download_input(request: HttpRequest, job_id: int) -> HttpResponse:
+    """
+    Скачивание загруженного входного файла задачи.
+    MEDIA_ROOT наружу не публикуется — файлы задач только через эти view.
+    """
+    job = get_object_or_404(TenderJob.objects.only("id", "input_file"), pk=job_id)
+    if not job.input_file:
+        raise Http404("Входной файл для этой задачи не загружен.")
+
+    return _job_file_response(job.input_file, "Входной файл не найден.")
+
+
 @login_required
 @require_http_methods(["GET", "POST"])
 def logout_view(request: HttpRequest) -> HttpResponse: